@@ -7,14 +7,20 @@ import time
 import math
 import asyncio
 import aiohttp
-import aiosqlite
-import sqlite3
-import numpy as np
 import pandas as pd
 import requests
 from tqdm import tqdm
-from datetime import datetime, timedelta
-import pytz
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+from indicators import add_indicators, touch_cross
+from candle_sync import last_saved_ts, append_tail, update_timeframes, candles_frame, aggregate_timeframes, bars_frame
+from candle_store import consolidate
+from sqlite_writer import write_table
+from snapshot import write_snapshot
+from heatmap import load_all, load_heatmap, lookup
+from okx_downloader import TF_PARAMS, rolling_cross_density
+from okx_client import TokenBucket, BAR_MS, fetch_sharded
 
 # === Папки ===
 BASE = r"C:\Users\777\PycharmProjects\Booster4\scoring_p\datasets"
@@ -24,51 +30,81 @@ FOLDERS = {
     "1d": os.path.join(BASE, "1dtf"),
 }
 
-# === Индикаторы ===
-def wma(series, period):
-    weights = list(range(1, period + 1))
-    return series.rolling(period).apply(lambda x: sum(w * val for w, val in zip(weights, x)) / sum(weights), raw=True)
-
-def hma(series, period):
-    half = int(period / 2)
-    sqrt_n = int(period ** 0.5)
-    return wma(2 * wma(series, half) - wma(series, period), sqrt_n)
-
 # === Вспомогательные ===
-def from_ts_to_dt(ts: int) -> datetime:
-    dt_utc = datetime.fromtimestamp(ts / 1000, tz=pytz.UTC)
-    return dt_utc.astimezone(pytz.timezone("Europe/Moscow"))
-
-def resample(df, rule, offset=None):
-    df["datetime"] = pd.to_datetime(df["date"] + df["time"], format="%Y%m%d%H%M%S")
-    df.set_index("datetime", inplace=True)
-    if offset:
-        df.index = df.index - offset
-    agg = {"open": "first", "high": "max", "low": "min", "close": "last", "vol": "sum"}
-    df_res = df.resample(rule).agg(agg).dropna()
-    if offset:
-        df_res.index = df_res.index + offset
-    df_res["date"] = df_res.index.strftime("%Y%m%d")
-    df_res["time"] = df_res.index.strftime("%H%M%S")
-    return df_res.reset_index(drop=True)
-
 def clean_folder(path):
     os.makedirs(path, exist_ok=True)
     for file in os.listdir(path):
         if file.endswith(".sqlite"):
             os.remove(os.path.join(path, file))
 
-def save_to_sqlite(df, tf, ticker):
-    folder = FOLDERS[tf]
-    db_path = os.path.join(folder, f"{ticker}_{tf}.sqlite")
+def db_path_for(tf, ticker):
+    return os.path.join(FOLDERS[tf], f"{ticker}_{tf}.sqlite")
+
+def columns_for(tf):
     if tf == "1d":
-        columns = ["ticker", "per", "date", "time", "open", "high", "low", "close", "vol", "amplitude"]
-    else:
-        columns = ["ticker", "per", "date", "time", "open", "high", "low", "close", "vol",
-                   "amplitude", "hma9", "hma21", "hma_cross"]
-    df = df[columns]
-    with sqlite3.connect(db_path) as conn:
-        df.to_sql("candles", conn, if_exists="replace", index=False)
+        return ["ticker", "per", "date", "time", "open", "high", "low", "close", "vol", "amplitude"]
+    return ["ticker", "per", "date", "time", "open", "high", "low", "close", "vol",
+            "amplitude", "hma9", "hma21", "hma_cross"]
+
+def save_to_sqlite(df, tf, ticker, columns=None):
+    write_table(db_path_for(tf, ticker), df[columns or columns_for(tf)])
+
+STATS_COLUMNS = ["amp_mean_hist", "zscore_delta", "amp_eff_last3", "amp_eff_last6"]
+
+def stored_columns(tf, heatmap=None):
+    """Колонки таблицы tf вместе с колонками шагов 2–3 — так её пишут build_timeframes и sync_tail."""
+    if tf == "3m":
+        return columns_for("3m") + ["density_hma_cross"]
+    if tf == "1h":
+        return columns_for("1h") + (STATS_COLUMNS if heatmap is not None else []) + ["density_hma_cross"]
+    return columns_for("1d") + ["amp_eff_avg"]
+
+def add_density(df):
+    """density_hma_cross 3m-кадра: число кроссов в предыдущих window свечах."""
+    p = TF_PARAMS["3mtf"]
+    df["density_hma_cross"] = rolling_cross_density(compute_hma_cross(df), df["time"], p["window"], p["start_minute"])
+    return df
+
+def build_timeframes(ts, ohlcv, ticker):
+    """Полная сборка 3m/1h/1d из массивов ts/OHLCV: старшие ТФ — одним проходом aggregate_timeframes.
+
+    Колонки шагов 2 и 3 (статистика по тепловой карте, плотность кроссов, amp_eff_avg)
+    считаются здесь же в памяти, поэтому каждая таблица пишется ровно один раз.
+    """
+    df = add_density(add_indicators(candles_frame(ts, ohlcv, ticker, "3")))
+    save_to_sqlite(df, "3m", ticker, stored_columns("3m"))
+
+    bars = aggregate_timeframes(ts, ohlcv, compute_hma_cross(df).to_numpy())
+    df_1h = bars_frame(bars["1h"], ticker, "60")
+    add_indicators(df_1h)
+    heatmap = load_heatmap(ticker)
+    if heatmap is not None:
+        add_stats(df_1h, heatmap)
+    save_to_sqlite(df_1h, "1h", ticker, stored_columns("1h", heatmap))
+
+    df_1d = bars_frame(bars["1d"], ticker, "1440")
+    add_indicators(df_1d)
+    save_to_sqlite(df_1d, "1d", ticker, stored_columns("1d"))
+
+def sync_tail(df_new, ticker, total_candles):
+    """Дописывает новые 3m-свечи и обновляет в 1h/1d только затронутые бакеты.
+
+    Колонки шагов 2–3 считаются для хвоста по тому же окну прогрева, что и HMA:
+    плотность кроссов 3m, статистика по тепловой карте у 1h, плотность 1h и amp_eff_avg 1d
+    из агрегации затронутых бакетов. Возвращает {tf: переписанные строки} — ровно то,
+    что изменилось в пофайловых базах.
+    """
+    df_new["ticker"] = ticker
+    df_new["per"] = "3"
+    path_3m = db_path_for("3m", ticker)
+    heatmap = load_heatmap(ticker)
+    columns = {tf: stored_columns(tf, heatmap) for tf in FOLDERS}
+    tails = {"3m": append_tail(path_3m, df_new, columns["3m"], keep=total_candles, derive=add_density)}
+    derive = {"1h": lambda df: add_stats(df, heatmap)} if heatmap is not None else None
+    tails.update(update_timeframes(
+        path_3m, {tf: db_path_for(tf, ticker) for tf in ["1h", "1d"]}, columns, df_new, derive
+    ))
+    return {tf: tail[columns[tf]] for tf, tail in tails.items() if not tail.empty}
 
 
 tickers_top = [
@@ -86,108 +122,93 @@ tickers_top = [
 ]
 
 # === Шаг 1: Загрузка и обработка котировок ===
-async def fetch_and_save(session, sem, inst_id, index, total, tf="3m", limit=100, total_candles=3360):
+# Корутины только качают свечи и кладут их в ограниченную очередь; DataFrame, ресемплинг,
+# индикаторы и запись в SQLite выполняются в пуле процессов, чтобы не блокировать event loop.
+def build_and_save(ticker, ts, ohlcv, last_ts, total_candles):
+    if not len(ts):
+        return
+    if last_ts is not None:
+        sync_tail(candles_frame(ts, ohlcv, ticker, "3"), ticker, total_candles)
+    else:
+        build_timeframes(ts, ohlcv, ticker)
+
+def print_progress(done, total):
+    bar_len = 30
+    filled = int(bar_len * done // total)
+    bar = '█' * filled + '-' * (bar_len - filled)
+    sys.stdout.write(f"\rProgress: |{bar}| {(done / total) * 100:.1f}%")
+    sys.stdout.flush()
+
+async def compute_worker(queue, pool, progress, total):
+    loop = asyncio.get_running_loop()
+    while True:
+        item = await queue.get()
+        try:
+            if item is None:
+                return
+            try:
+                await loop.run_in_executor(pool, build_and_save, *item)
+            except Exception as e:
+                print(f"\n❌ Ошибка расчёта {item[0]}: {e}")
+            progress[0] += 1
+            print_progress(progress[0], total)
+        finally:
+            queue.task_done()
+
+async def fetch_and_save(session, sem, limiter, inst_id, queue, tf="3m", limit=100, total_candles=3360, sync=False, shards=1):
     async with sem:
         ticker = inst_id.replace("-", "")
-        after = ""
-        candles = {}
-
-        while len(candles) < total_candles:
-            params = {"instId": inst_id, "bar": tf, "limit": str(limit)}
-            if after: params["after"] = after
-            url = "https://www.okx.com/api/v5/market/history-candles"
-
-            for attempt in range(2):
-                try:
-                    async with session.get(url, params=params) as resp:
-                        if resp.status != 200:
-                            await asyncio.sleep(5)
-                            continue
-                        data = (await resp.json()).get("data", [])
-                        if not data: break
-                        for c in data:
-                            ts = int(c[0])
-                            if ts not in candles:
-                                candles[ts] = {
-                                    "ticker": ticker, "per": "3", "t": from_ts_to_dt(ts),
-                                    "open": float(c[1]), "high": float(c[2]),
-                                    "low": float(c[3]), "close": float(c[4]), "vol": float(c[7])
-                                }
-                        after = str(int(data[-1][0]))
-                        await asyncio.sleep(0.25)
-                        break
-                except Exception:
-                    await asyncio.sleep(10)
-
-        df = pd.DataFrame(sorted(candles.values(), key=lambda x: x["t"]))
-        df["date"] = df["t"].dt.strftime("%Y%m%d")
-        df["time"] = df["t"].dt.strftime("%H%M%S")
-        df.drop(columns=["t"], inplace=True)
-
-        for timeframe, rule, per, offset in [("3m", None, "3", None), ("1h", "1h", "60", None), ("1d", "1d", "1440", pd.Timedelta(hours=3))]:
-            dfx = df.copy() if timeframe == "3m" else resample(df.copy(), rule, offset)
-            dfx["ticker"] = ticker
-            dfx["per"] = per
-            dfx["hma9"] = hma(dfx["close"], 9)
-            dfx["hma21"] = hma(dfx["close"], 21)
-            dfx["amplitude"] = 2 * (dfx["high"] - dfx["low"]) / (dfx["high"] + dfx["low"]) * 100
-            dfx["hma_cross"] = 0
-            prev9 = dfx["hma9"].shift(1)
-            prev21 = dfx["hma21"].shift(1)
-            dfx.loc[(prev9 < prev21) & (dfx["hma9"] > dfx["hma21"]), "hma_cross"] = 1
-            dfx.loc[(prev9 > prev21) & (dfx["hma9"] < dfx["hma21"]), "hma_cross"] = -1
-            save_to_sqlite(dfx, timeframe, ticker)
-
-        bar_len = 30
-        filled = int(bar_len * (index + 1) // total)
-        bar = '█' * filled + '-' * (bar_len - filled)
-        sys.stdout.write(f"\rProgress: |{bar}| {((index + 1) / total) * 100:.1f}%")
-        sys.stdout.flush()
-
-async def step1_download():
+        # В режиме синхронизации качаем только от последней сохранённой свечи
+        last_ts = last_saved_ts(db_path_for("3m", ticker)) if sync else None
+
+        # Диапазон: total_candles баров до текущего (незакрытого) включительно, с запасом на расхождение часов
+        bar_ms = BAR_MS[tf]
+        end_ts = (int(time.time() * 1000) // bar_ms + 2) * bar_ms
+        start_ts = end_ts - total_candles * bar_ms
+        if last_ts is not None:
+            # Последняя сохранённая свеча могла быть незакрытой — перезаписываем и её
+            start_ts = max(start_ts, last_ts)
+
+        candles, ok = await fetch_sharded(session, limiter, inst_id, tf, start_ts, end_ts, shards, limit)
+        if not ok:
+            print(f"\n⚠️ {inst_id}: OKX не ответил после всех попыток, берём то, что успели загрузить")
+        ts, ohlcv = candles.arrays()
+
+        # Ждём места в очереди, не отпуская семафор, — так загрузка не убегает вперёд расчёта
+        await queue.put((ticker, ts, ohlcv, last_ts, total_candles))
+
+async def step1_download(sync=False, workers=1, shards=1):
+    # sync=True: не очищаем папки, а догружаем только недостающие свечи
     for folder in FOLDERS.values():
-        clean_folder(folder)
+        if sync:
+            os.makedirs(folder, exist_ok=True)
+        else:
+            clean_folder(folder)
     print(f"🔎 Загружаем {len(tickers_top)} тикеров")
     sem = asyncio.Semaphore(5)
-    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=30)) as session:
-        tasks = [fetch_and_save(session, sem, inst_id, i, len(tickers_top)) for i, inst_id in enumerate(tickers_top)]
-        await asyncio.gather(*tasks)
+    limiter = TokenBucket.for_endpoint()
+    queue = asyncio.Queue(maxsize=2 * workers)
+    progress = [0]
+    try:
+        load_all()  # и сборка, и хвосты сразу обогащают 1h — разбираем книгу до запуска воркеров
+    except Exception as e:
+        print(f"\n⚠️ Тепловая карта недоступна: {e}")
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        consumers = [asyncio.create_task(compute_worker(queue, pool, progress, len(tickers_top))) for _ in range(workers)]
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=30)) as session:
+            tasks = [fetch_and_save(session, sem, limiter, inst_id, queue, sync=sync, shards=shards) for inst_id in tickers_top]
+            await asyncio.gather(*tasks)
+        for _ in consumers:
+            await queue.put(None)
+        await asyncio.gather(*consumers)
     print("\n✅ Загрузка завершена")
 
 # === Шаг 2: Z-оценка по тепловой карте ===
-HEATMAP_PATH = r"C:\Users\777\PycharmProjects\Booster4\WarmMaps\RESULT_HEAT_MAP.xlsx"
-DB_FOLDER = FOLDERS["1h"]
-WEEKDAY_MAP = {0: "Пн", 1: "Вт", 2: "Ср", 3: "Чт", 4: "Пт", 5: "Сб", 6: "Вс"}
-
-def load_heatmap(ticker: str) -> dict:
-    try:
-        df = pd.read_excel(HEATMAP_PATH, sheet_name=f"{ticker}_H1")
-        df = df.loc[:, ~df.columns.str.contains("Среднее|Медиана")]
-        return {(row["weekday_name"], hour): row[hour] for _, row in df.iterrows() for hour in df.columns[1:]}
-    except Exception:
-        return {}
-
-def get_weekday_hour_key(date_str: str, time_str: str):
-    try:
-        dt = datetime.strptime(date_str + time_str, "%Y%m%d%H%M%S")
-        return WEEKDAY_MAP[dt.weekday()], dt.strftime("%H:00")
-    except:
-        return None, None
-
 def add_stats(df, heatmap):
     df["amplitude"] = pd.to_numeric(df["amplitude"], errors="coerce")
 
-    # Историческая эффективность
-    amp_mean_hist, zscores = [], []
-    for date, time, amp in zip(df["date"], df["time"], df["amplitude"]):
-        key = get_weekday_hour_key(str(date), str(time))
-        mean = heatmap.get(key, np.nan)
-        delta = amp - mean if pd.notna(mean) and pd.notna(amp) else np.nan
-        amp_mean_hist.append(mean)
-        zscores.append(delta)
-
-    df["amp_mean_hist"] = amp_mean_hist
-    df["zscore_delta"] = zscores
+    # Историческая эффективность: heatmap — массив 7×24, индексы считаются сразу по всей колонке
+    df["amp_mean_hist"], df["zscore_delta"] = lookup(df, heatmap)
 
     # Текущая эффективность по последним 3 и 6 свечам
     df["amp_eff_last3"] = df["amplitude"].rolling(window=3).mean()
@@ -195,57 +216,32 @@ def add_stats(df, heatmap):
 
     return df
 
-async def step2_enrich():
-    files = [f for f in os.listdir(DB_FOLDER) if f.endswith(".sqlite")]
-    sem = asyncio.Semaphore(6)
-
-    async def process_file(file):
-        async with sem:
-            db_path = os.path.join(DB_FOLDER, file)
-            ticker = file.replace("_1h.sqlite", "")
-            heatmap = load_heatmap(ticker)
-            if not heatmap: return
-            async with aiosqlite.connect(db_path) as conn:
-                cursor = await conn.execute("SELECT * FROM candles")
-                columns = [col[0] for col in cursor.description]
-                rows = await cursor.fetchall()
-                df = pd.DataFrame(rows, columns=columns)
-                df = add_stats(df, heatmap)
-                await conn.execute("DROP TABLE IF EXISTS candles")
-                cols = ",".join(f"{col} TEXT" for col in df.columns)
-                await conn.execute(f"CREATE TABLE candles ({cols})")
-                await conn.executemany(
-                    f"INSERT INTO candles VALUES ({','.join(['?'] * len(df.columns))})",
-                    df.values.tolist()
-                )
-                await conn.commit()
-
-    await asyncio.gather(*[process_file(f) for f in files])
-    print("\n✅ Обогащение завершено")
-
 # === Шаг 3: Расчёт плотности HMA-cross ===
 def compute_hma_cross(df):
-    hma9 = pd.to_numeric(df["hma9"], errors="coerce")
-    hma21 = pd.to_numeric(df["hma21"], errors="coerce")
-    return ((hma9 > hma21) & (hma9.shift(1) <= hma21.shift(1))) | ((hma9 < hma21) & (hma9.shift(1) >= hma21.shift(1)))
+    return touch_cross(pd.to_numeric(df["hma9"], errors="coerce"), pd.to_numeric(df["hma21"], errors="coerce"))
 
-def step3_density():
-    from okx_downloader import process_3mtf, process_1htf, process_1dtf
-    process_3mtf()
-    process_1htf()
-    process_1dtf()
-    print("\n✅ Плотность HMA-кроссов рассчитана")
+# === Шаг 4: Перенос в единое хранилище и бинарный снимок ===
+def step4_store():
+    # Изменившиеся ряды получают новую версию — по ней дашборд дочитывает только их хвосты
+    published = consolidate(BASE)
+    write_snapshot()
+    print(f"\n✅ Единое хранилище и снимок обновлены, новых версий рядов: {len(published)}")
 
 # === Полный пайплайн ===
-async def full_pipeline():
+async def full_pipeline(sync=False, workers=1, shards=1):
     start_time = time.time()
     print("\n🔽 Шаг 1: Загрузка котировок с OKX...")
-    await step1_download()
-    print("\n📊 Шаг 2: Обогащение баз по тепловым картам...")
-    await step2_enrich()
-    print("\n📈 Шаг 3: Расчёт плотности HMA-кроссов...")
-    step3_density()
+    await step1_download(sync=sync, workers=workers, shards=shards)
+    # И полная сборка, и догрузка хвоста (sync_tail) сразу пишут колонки шагов 2–3
+    print("\n📊 Шаги 2–3: обогащение и плотность рассчитаны при сборке")
+    print("\n🗄️ Шаг 4: Перенос в единое хранилище...")
+    step4_store()
     print(f"\n✅ Все этапы выполнены за {time.time() - start_time:.2f} секунд")
 
 if __name__ == "__main__":
-    asyncio.run(full_pipeline())
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sync", action="store_true", help="догрузить только новые свечи вместо полной перезагрузки")
+    parser.add_argument("--workers", type=int, default=1, help="число процессов для расчёта индикаторов, обогащения и плотности")
+    parser.add_argument("--shards", type=int, default=1, help="на сколько временных окон делить историю тикера при загрузке")
+    args = parser.parse_args()
+    asyncio.run(full_pipeline(sync=args.sync, workers=args.workers, shards=args.shards))
@@ -0,0 +1,81 @@
+import os
+import time
+import sqlite3
+import argparse
+import tempfile
+import numpy as np
+import pandas as pd
+
+from candle_store import column_type
+from sqlite_writer import write_table
+
+# === Сравнение путей записи: to_sql, executemany(tolist) и write_table ===
+
+def make_frame(rows, seed=0):
+    """Синтетическая 1h-таблица того же состава, что пишет пайплайн."""
+    rng = np.random.default_rng(seed)
+    dt = pd.date_range("2025-01-01", periods=rows, freq="3min")
+    close = 100 + rng.standard_normal(rows).cumsum()
+    df = pd.DataFrame({
+        "ticker": "BTCUSDTSWAP", "per": "3",
+        "date": dt.strftime("%Y%m%d"), "time": dt.strftime("%H%M%S"),
+        "open": close + rng.standard_normal(rows) * 0.1, "high": close + 1, "low": close - 1,
+        "close": close, "vol": rng.random(rows) * 1e6,
+    })
+    df["amplitude"] = 2 * (df["high"] - df["low"]) / (df["high"] + df["low"]) * 100
+    df["hma9"], df["hma21"] = close, close
+    df["hma_cross"] = rng.integers(-1, 2, rows)
+    df["amp_mean_hist"] = np.where(rng.random(rows) < 0.1, np.nan, rng.random(rows))
+    df["zscore_delta"] = df["amplitude"] - df["amp_mean_hist"]
+    df["amp_eff_last3"] = df["amplitude"].rolling(3).mean()
+    df["amp_eff_last6"] = df["amplitude"].rolling(6).mean()
+    df["density_hma_cross"] = rng.integers(0, 5, rows)
+    return df
+
+
+def write_to_sql(path, df):
+    with sqlite3.connect(path) as conn:
+        df.to_sql("candles", conn, if_exists="replace", index=False)
+
+
+def write_tolist(path, df):
+    with sqlite3.connect(path) as conn:
+        conn.execute("DROP TABLE IF EXISTS candles")
+        cols = ",".join(f"{col} {column_type(col)}" for col in df.columns)
+        conn.execute(f"CREATE TABLE candles ({cols})")
+        conn.executemany(
+            f"INSERT INTO candles VALUES ({','.join(['?'] * len(df.columns))})",
+            df.values.tolist()
+        )
+
+
+METHODS = {"to_sql": write_to_sql, "executemany(tolist)": write_tolist, "write_table": write_table}
+
+
+def bench(tables, rows, repeat, folder=None):
+    frames = [make_frame(rows, seed) for seed in range(tables)]
+    results = {}
+    with tempfile.TemporaryDirectory(dir=folder) as tmp:
+        for name, func in METHODS.items():
+            best = float("inf")
+            for _ in range(repeat):
+                start = time.perf_counter()
+                for i, df in enumerate(frames):
+                    func(os.path.join(tmp, f"{name[:6]}_{i}.sqlite"), df)
+                best = min(best, time.perf_counter() - start)
+            results[name] = best
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tables", type=int, default=55, help="сколько таблиц писать за прогон (по числу тикеров)")
+    parser.add_argument("--rows", type=int, default=3360, help="строк в таблице")
+    parser.add_argument("--repeat", type=int, default=3, help="повторов, берётся лучший")
+    parser.add_argument("--dir", default=None, help="папка для временных баз (тот же диск, что и datasets)")
+    args = parser.parse_args()
+    results = bench(args.tables, args.rows, args.repeat, args.dir)
+    base = results["to_sql"]
+    print(f"{args.tables} таблиц × {args.rows} строк, лучший из {args.repeat}:")
+    for name, sec in results.items():
+        print(f"  {name:<20} {sec:8.3f} с   ×{base / sec:.2f}")
@@ -0,0 +1,384 @@
+import os
+import time
+import sqlite3
+import numpy as np
+import pandas as pd
+
+# === Единое хранилище свечей ===
+BASE = r"C:\Users\777\PycharmProjects\Booster4\scoring_p\datasets"
+STORE_PATH = os.path.join(BASE, "candles.sqlite")
+TF_FOLDERS = {"3m": "3mtf", "1h": "1htf", "1d": "1dtf"}
+
+# Типы колонок: всё, что не TEXT и не INTEGER, хранится как REAL
+TEXT_COLUMNS = {"ticker", "tf", "per", "date", "time"}
+INTEGER_COLUMNS = {"ts", "hma_cross", "density_hma_cross"}
+VALUE_COLUMNS = [
+    "open", "high", "low", "close", "vol", "amplitude", "hma9", "hma21", "hma_cross",
+    "density_hma_cross", "amp_mean_hist", "zscore_delta", "amp_eff_last3", "amp_eff_last6", "amp_eff_avg",
+]
+STORE_COLUMNS = ["ticker", "tf", "ts", "date", "time"] + VALUE_COLUMNS
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS candles (
+    ticker TEXT NOT NULL,
+    tf TEXT NOT NULL,
+    ts INTEGER NOT NULL,
+    date TEXT,
+    time TEXT,
+    {", ".join(f"{col} {'INTEGER' if col in INTEGER_COLUMNS else 'REAL'}" for col in VALUE_COLUMNS)},
+    PRIMARY KEY (ticker, tf, ts)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_candles_tf_ts ON candles (tf, ts);
+CREATE TABLE IF NOT EXISTS cross_counts (
+    ticker TEXT NOT NULL,
+    period TEXT NOT NULL,
+    ts INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (ticker, period, ts)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS series_versions (
+    ticker TEXT NOT NULL,
+    tf TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    first_ts INTEGER,
+    last_ts INTEGER,
+    published INTEGER NOT NULL,
+    PRIMARY KEY (ticker, tf)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS series_changes (
+    ticker TEXT NOT NULL,
+    tf TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    changed_ts INTEGER,
+    PRIMARY KEY (ticker, tf, version)
+) WITHOUT ROWID;
+"""
+
+# Сутки для подсчёта кроссов — календарные по Москве (UTC+3 без перехода на летнее время)
+MSK_OFFSET_MS = 3 * 3_600_000
+DAY_MS = 86_400_000
+# Сколько последних публикаций ряда хранит журнал series_changes
+KEEP_CHANGES = 500
+
+
+def column_type(col: str) -> str:
+    if col in TEXT_COLUMNS:
+        return "TEXT"
+    if col in INTEGER_COLUMNS:
+        return "INTEGER"
+    return "REAL"
+
+
+def epoch_ms(date, time) -> np.ndarray:
+    """Epoch-ms из московских строк date/time (векторно)."""
+    dt = pd.to_datetime(pd.Series(date, dtype=str) + pd.Series(time, dtype=str), format="%Y%m%d%H%M%S")
+    dt = dt.dt.tz_localize("Europe/Moscow").dt.tz_convert(None)
+    return ((dt - pd.Timestamp(0)) // pd.Timedelta(milliseconds=1)).to_numpy(dtype=np.int64)
+
+
+def connect(path=STORE_PATH):
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+# === Запись ===
+def _rows(df, ticker, tf):
+    n = len(df)
+    cols = {"ticker": [ticker] * n, "tf": [tf] * n}
+    if "ts" in df.columns:
+        cols["ts"] = df["ts"].to_numpy(dtype=np.int64)
+    else:
+        cols["ts"] = epoch_ms(df["date"].to_numpy(), df["time"].to_numpy())
+    for col in ["date", "time"]:
+        cols[col] = df[col].astype(str).to_numpy()
+    for col in VALUE_COLUMNS:
+        if col not in df.columns:
+            cols[col] = [None] * n
+            continue
+        values = pd.to_numeric(df[col], errors="coerce").to_numpy(dtype=np.float64)
+        missing = np.isnan(values)
+        if col in INTEGER_COLUMNS:
+            out = np.where(missing, 0, values).astype(np.int64).astype(object)
+        else:
+            out = values.astype(object)
+        out[missing] = None
+        cols[col] = out
+    cols["ts"] = cols["ts"].tolist()
+    return zip(*(cols[col] for col in STORE_COLUMNS))
+
+
+def publish_series(conn, df, ticker, tf):
+    """Записывает ряд целиком, но в candles меняет только то, что отличается от хранимого.
+
+    Сравнение идёт в SQL через временную таблицу: находится первый ts, с которого
+    строки разошлись (новые, изменённые или пропавшие), — хвост с него заменяется,
+    строки раньше нового начала ряда удаляются. Если что-то изменилось, версия ряда
+    в series_versions растёт на 1, а в series_changes пишется changed_ts — по нему
+    читатели догружают только хвост. Возвращает новую версию или None.
+    """
+    values = ["date", "time"] + VALUE_COLUMNS
+    series = "ticker = ? AND tf = ?"
+    with conn:
+        conn.execute(
+            f"CREATE TEMP TABLE IF NOT EXISTS incoming "
+            f"({', '.join(f'{col} {column_type(col)}' for col in STORE_COLUMNS)}, PRIMARY KEY (ts))"
+        )
+        conn.execute("DELETE FROM incoming")
+        conn.executemany(
+            f"INSERT OR REPLACE INTO incoming ({', '.join(STORE_COLUMNS)}) "
+            f"VALUES ({', '.join('?' * len(STORE_COLUMNS))})",
+            _rows(df, ticker, tf),
+        )
+        first_ts, last_ts = conn.execute("SELECT MIN(ts), MAX(ts) FROM incoming").fetchone()
+        # Пустой источник — ряд удаляется целиком
+        head_ts = first_ts if first_ts is not None else 2**62
+        differs = " OR ".join(f"c.{col} IS NOT i.{col}" for col in values)
+        changed_new = conn.execute(
+            f"SELECT MIN(i.ts) FROM incoming i LEFT JOIN candles c ON c.ticker = ? AND c.tf = ? AND c.ts = i.ts "
+            f"WHERE c.ts IS NULL OR {differs}",
+            (ticker, tf),
+        ).fetchone()[0]
+        changed_old = conn.execute(
+            f"SELECT MIN(ts) FROM candles c WHERE {series} AND ts >= ? "
+            f"AND NOT EXISTS (SELECT 1 FROM incoming i WHERE i.ts = c.ts)",
+            (ticker, tf, head_ts),
+        ).fetchone()[0]
+        changed = [ts for ts in (changed_new, changed_old) if ts is not None]
+        changed_ts = min(changed) if changed else None
+        trimmed = conn.execute(
+            f"SELECT EXISTS (SELECT 1 FROM candles WHERE {series} AND ts < ?)", (ticker, tf, head_ts)
+        ).fetchone()[0]
+        if changed_ts is None and not trimmed:
+            return None
+
+        conn.execute(f"DELETE FROM candles WHERE {series} AND ts < ?", (ticker, tf, head_ts))
+        if changed_ts is not None:
+            conn.execute(f"DELETE FROM candles WHERE {series} AND ts >= ?", (ticker, tf, changed_ts))
+            conn.execute(
+                f"INSERT INTO candles ({', '.join(STORE_COLUMNS)}) "
+                f"SELECT {', '.join(STORE_COLUMNS)} FROM incoming WHERE ts >= ?",
+                (changed_ts,),
+            )
+        return _bump_version(conn, ticker, tf, first_ts, last_ts, changed_ts)
+
+
+def _bump_version(conn, ticker, tf, first_ts, last_ts, changed_ts):
+    """Новая версия ряда и запись в журнал изменений (внутри транзакции вызывающего)."""
+    row = conn.execute("SELECT version FROM series_versions WHERE ticker = ? AND tf = ?", (ticker, tf)).fetchone()
+    version = (row[0] if row else 0) + 1
+    conn.execute(
+        "INSERT OR REPLACE INTO series_versions (ticker, tf, version, first_ts, last_ts, published) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        (ticker, tf, version, first_ts, last_ts, int(time.time() * 1000)),
+    )
+    conn.execute(
+        "INSERT INTO series_changes (ticker, tf, version, changed_ts) VALUES (?, ?, ?, ?)",
+        (ticker, tf, version, changed_ts),
+    )
+    conn.execute(
+        "DELETE FROM series_changes WHERE ticker = ? AND tf = ? AND version <= ?",
+        (ticker, tf, version - KEEP_CHANGES),
+    )
+    return version
+
+
+def publish_tails(tails, path=STORE_PATH):
+    """Публикует хвосты рядов одной транзакцией — живой режим, все тикеры закрытого бара.
+
+    tails — [(ticker, tf, df, first_ts)]: строки df заменяют в ряду всё начиная с их
+    первого ts, строки раньше first_ts (начало ряда в пофайловой базе) удаляются.
+    В отличие от publish_series, хранимый ряд не сравнивается — хвост известен заранее.
+    Возвращает {(ticker, tf): новая версия}.
+    """
+    published = {}
+    conn = connect(path)
+    try:
+        with conn:
+            for ticker, tf, df, first_ts in tails:
+                rows = list(_rows(df, ticker, tf))
+                if not rows:
+                    continue
+                changed_ts = min(row[2] for row in rows)
+                last_ts = max(row[2] for row in rows)
+                head_ts = min(changed_ts, first_ts) if first_ts is not None else changed_ts
+                conn.execute(
+                    "DELETE FROM candles WHERE ticker = ? AND tf = ? AND (ts >= ? OR ts < ?)",
+                    (ticker, tf, changed_ts, head_ts),
+                )
+                conn.executemany(
+                    f"INSERT OR REPLACE INTO candles ({', '.join(STORE_COLUMNS)}) "
+                    f"VALUES ({', '.join('?' * len(STORE_COLUMNS))})",
+                    rows,
+                )
+                published[(ticker, tf)] = _bump_version(conn, ticker, tf, head_ts, last_ts, changed_ts)
+            for ticker in sorted({t for t, tf in published if tf == "1h"}):
+                _materialize_cross_counts(conn, ticker)
+    finally:
+        conn.close()
+    return published
+
+
+# === Чтение ===
+def read_candles(ticker, tf, columns=None, since_ts=None, path=STORE_PATH):
+    cols = ", ".join(columns) if columns else ", ".join(STORE_COLUMNS)
+    query = f"SELECT {cols} FROM candles WHERE ticker = ? AND tf = ?"
+    params = [ticker, tf]
+    if since_ts is not None:
+        query += " AND ts >= ?"
+        params.append(int(since_ts))
+    with sqlite3.connect(path) as conn:
+        return pd.read_sql_query(query + " ORDER BY ts", conn, params=params)
+
+
+def read_column(tf, column, path=STORE_PATH):
+    """Одна колонка по всем тикерам таймфрейма — один индексный запрос."""
+    with sqlite3.connect(path) as conn:
+        return pd.read_sql_query(
+            f"SELECT ticker, ts, {column} FROM candles WHERE tf = ? ORDER BY ticker, ts",
+            conn, params=(tf,),
+        )
+
+
+def read_matrix(tf, columns, window, path=STORE_PATH):
+    """Последние window свечей каждого тикера как 2-D массивы (тикер × время).
+
+    Ряды выровнены по правому краю: последняя свеча в последнем столбце, недостающие
+    слева — NaN. Возвращает (список тикеров, {колонка: массив float64}).
+    """
+    cols = ["ts"] + [c for c in columns if c != "ts"]
+    with sqlite3.connect(path) as conn:
+        df = pd.read_sql_query(
+            f"SELECT ticker, {', '.join(cols)} FROM ("
+            f"  SELECT ticker, {', '.join(cols)}, ROW_NUMBER() OVER (PARTITION BY ticker ORDER BY ts DESC) AS rn"
+            f"  FROM candles WHERE tf = ?"
+            f") WHERE rn <= ? ORDER BY ticker, ts",
+            conn, params=(tf, int(window)),
+        )
+    codes, tickers = pd.factorize(df["ticker"], sort=True)
+    ends = np.searchsorted(codes, np.arange(len(tickers)), side="right")
+    pos = window - ends[codes] + np.arange(len(df))
+    matrix = {}
+    for col in cols:
+        arr = np.full((len(tickers), window), np.nan)
+        arr[codes, pos] = pd.to_numeric(df[col], errors="coerce").to_numpy(dtype=np.float64)
+        matrix[col] = arr
+    return list(tickers), matrix
+
+
+def read_cross_counts(ticker, period, start_ts=None, end_ts=None, path=STORE_PATH):
+    """Готовое число HMA-кроссов по часам (period="1h") или московским суткам ("1d").
+
+    ts — начало периода (epoch-ms), фильтр start_ts <= ts < end_ts выполняет SQLite по ключу.
+    """
+    query = "SELECT ts, count FROM cross_counts WHERE ticker = ? AND period = ?"
+    params = [ticker, period]
+    if start_ts is not None:
+        query += " AND ts >= ?"
+        params.append(int(start_ts))
+    if end_ts is not None:
+        query += " AND ts < ?"
+        params.append(int(end_ts))
+    with sqlite3.connect(path) as conn:
+        return pd.read_sql_query(query + " ORDER BY ts", conn, params=params)
+
+
+def read_versions(path=STORE_PATH):
+    """{(ticker, tf): версия} всех опубликованных рядов; {} — в хранилище ещё нет версий."""
+    if not os.path.exists(path):
+        return {}
+    try:
+        with sqlite3.connect(path) as conn:
+            return {(t, tf): v for t, tf, v in conn.execute("SELECT ticker, tf, version FROM series_versions")}
+    except sqlite3.OperationalError:
+        return {}
+
+
+def read_changes(ticker, tf, since_version, path=STORE_PATH):
+    """Что изменилось в ряду после версии since_version: (changed_ts, first_ts).
+
+    changed_ts — с какого ts строки надо перечитать (None — менялось только начало ряда),
+    first_ts — где ряд начинается теперь. None, если журнал уже не покрывает все
+    версии после since_version, — тогда ряд нужно прочитать целиком.
+    """
+    with sqlite3.connect(path) as conn:
+        oldest, changed_ts = conn.execute(
+            "SELECT MIN(version), MIN(changed_ts) FROM series_changes WHERE ticker = ? AND tf = ? AND version > ?",
+            (ticker, tf, int(since_version)),
+        ).fetchone()
+        if oldest != since_version + 1:
+            return None
+        first_ts = conn.execute(
+            "SELECT first_ts FROM series_versions WHERE ticker = ? AND tf = ?", (ticker, tf)
+        ).fetchone()[0]
+    return changed_ts, first_ts
+
+
+def list_tickers(tf, path=STORE_PATH):
+    with sqlite3.connect(path) as conn:
+        return [r[0] for r in conn.execute("SELECT DISTINCT ticker FROM candles WHERE tf = ? ORDER BY ticker", (tf,))]
+
+
+# === Материализованные агрегаты ===
+def _materialize_cross_counts(conn, ticker=None):
+    only = "" if ticker is None else " AND ticker = ?"
+    params = () if ticker is None else (ticker,)
+    conn.execute(f"DELETE FROM cross_counts WHERE 1{only}", params)
+    conn.execute(
+        "INSERT INTO cross_counts (ticker, period, ts, count) "
+        "SELECT ticker, '1h', ts, density_hma_cross FROM candles "
+        f"WHERE tf = '1h' AND density_hma_cross IS NOT NULL{only}",
+        params,
+    )
+    conn.execute(
+        "INSERT INTO cross_counts (ticker, period, ts, count) "
+        "SELECT ticker, '1d', (ts + ?) / ? * ? - ?, SUM(count) FROM cross_counts "
+        f"WHERE period = '1h'{only} GROUP BY ticker, (ts + ?) / ?",
+        (MSK_OFFSET_MS, DAY_MS, DAY_MS, MSK_OFFSET_MS) + params + (MSK_OFFSET_MS, DAY_MS),
+    )
+
+
+def materialize_cross_counts(conn, ticker=None):
+    """Пересобирает cross_counts (всех тикеров или одного): часовые счётчики — это
+    density_hma_cross из 1h, суточные — их сумма по московской дате. Всё в SQL одной транзакцией."""
+    with conn:
+        _materialize_cross_counts(conn, ticker)
+
+
+# === Перенос из пофайловых баз ===
+def _read_source(path):
+    with sqlite3.connect(path) as src:
+        df = pd.read_sql_query("SELECT * FROM candles", src)
+    df.columns = [c.lower().strip() for c in df.columns]
+    return df
+
+
+def consolidate(base=BASE, path=STORE_PATH):
+    """Переносит все {ticker}_{tf}.sqlite из папок 3mtf/1htf/1dtf в единое хранилище.
+
+    Ряды публикуются через publish_series: неизменившиеся строки не переписываются,
+    а у изменившихся рядов растёт версия. Возвращает {(ticker, tf): новая версия}.
+    """
+    published = {}
+    conn = connect(path)
+    try:
+        for tf, folder in TF_FOLDERS.items():
+            folder = os.path.join(base, folder)
+            if not os.path.isdir(folder):
+                continue
+            for file in sorted(os.listdir(folder)):
+                if not file.endswith(f"_{tf}.sqlite"):
+                    continue
+                ticker = file.replace(f"_{tf}.sqlite", "")
+                version = publish_series(conn, _read_source(os.path.join(folder, file)), ticker, tf)
+                if version is not None:
+                    published[(ticker, tf)] = version
+        materialize_cross_counts(conn)
+    finally:
+        conn.close()
+    return published
+
+
+if __name__ == "__main__":
+    consolidate()
+    print(f"✅ Хранилище обновлено: {STORE_PATH}")
@@ -0,0 +1,272 @@
+import os
+import sqlite3
+import numpy as np
+import pandas as pd
+import pytz
+
+from indicators import add_indicators, touch_cross
+from candle_store import epoch_ms
+
+# === Параметры синхронизации ===
+MSK = pytz.timezone("Europe/Moscow")
+# Строк истории перед новым хвостом: HMA(21) нужно 24 закрытия, hma_cross — ещё одно
+HMA_WARMUP = 64
+OHLCV = ["date", "time", "open", "high", "low", "close", "vol"]
+
+
+def to_epoch_ms(date: str, time: str) -> int:
+    dt = MSK.localize(pd.Timestamp(f"{date}{time}").to_pydatetime())
+    return int(dt.timestamp() * 1000)
+
+
+def msk_ms(ts) -> np.ndarray:
+    """Epoch-ms -> московское «настенное» время в тех же миллисекундах."""
+    local = pd.to_datetime(np.asarray(ts, dtype=np.int64), unit="ms", utc=True).tz_convert(MSK).tz_localize(None)
+    return local.to_numpy().astype("datetime64[ms]").astype(np.int64)
+
+
+def date_time_strings(local_ms):
+    """Колонки date (YYYYMMDD) и time (HHMMSS) из московских миллисекунд без strftime по строкам."""
+    local = np.asarray(local_ms, dtype=np.int64).astype("datetime64[ms]").astype("datetime64[s]")
+    day = local.astype("datetime64[D]")
+    date = np.char.replace(np.datetime_as_string(day, unit="D"), "-", "").astype(object)
+    sec = (local - day).astype(np.int64)
+    hhmmss = sec // 3600 * 10000 + sec % 3600 // 60 * 100 + sec % 60
+    return date, np.char.zfill(hhmmss.astype(str), 6).astype(object)
+
+
+def candles_frame(ts, ohlcv, ticker, per):
+    """DataFrame свечей из массивов ts/OHLCV: часовой пояс и date/time — одним проходом."""
+    df = pd.DataFrame(ohlcv, columns=OHLCV[2:])
+    df.insert(0, "ticker", ticker)
+    df.insert(1, "per", per)
+    df["date"], df["time"] = date_time_strings(msk_ms(ts))
+    return df
+
+
+# === Последняя сохранённая свеча ===
+def last_saved_ts(db_path):
+    if not os.path.exists(db_path):
+        return None
+    try:
+        with sqlite3.connect(db_path) as conn:
+            row = conn.execute(
+                "SELECT date, time FROM candles ORDER BY date DESC, time DESC LIMIT 1"
+            ).fetchone()
+    except sqlite3.Error:
+        return None
+    if row is None:
+        return None
+    return to_epoch_ms(str(row[0]), str(row[1]))
+
+
+def first_saved_ts(db_path):
+    """Epoch-ms самой старой свечи в базе или None."""
+    if not os.path.exists(db_path):
+        return None
+    try:
+        with sqlite3.connect(db_path) as conn:
+            row = conn.execute("SELECT date, time FROM candles ORDER BY date, time LIMIT 1").fetchone()
+    except sqlite3.Error:
+        return None
+    if row is None:
+        return None
+    return to_epoch_ms(str(row[0]), str(row[1]))
+
+
+def last_candles(db_path, n):
+    """Последние n свечей базы (OHLCV) по возрастанию времени; цены и объём — float."""
+    with sqlite3.connect(db_path) as conn:
+        df = pd.read_sql_query(
+            f"SELECT {', '.join(OHLCV)} FROM candles ORDER BY date DESC, time DESC LIMIT ?", conn, params=(n,),
+        ).iloc[::-1].reset_index(drop=True)
+    for col in OHLCV[2:]:
+        df[col] = pd.to_numeric(df[col], errors="coerce")
+    return df
+
+
+# === Дописать хвост с пересчётом производных колонок ===
+def append_tail(db_path, df_new, columns, keep=None, warmup=HMA_WARMUP, derive=None):
+    """Заменяет в базе свечи начиная с первой строки df_new и дописывает хвост.
+
+    HMA, amplitude и hma_cross считаются по warmup последним сохранённым
+    строкам плюс новым свечам — этого окна хватает, чтобы значения совпали
+    с полным пересчётом. derive(кадр) досчитывает по тому же окну остальные
+    производные колонки; колонки из columns, которых нет и после derive,
+    берутся из df_new. keep ограничивает длину таблицы последними барами.
+    """
+    first = df_new["date"].iloc[0] + df_new["time"].iloc[0]
+    with sqlite3.connect(db_path) as conn:
+        has_table = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'candles'").fetchone()
+        if not has_table:
+            hist = pd.DataFrame(columns=OHLCV)
+        else:
+            hist = pd.read_sql_query(
+                f"SELECT {', '.join(OHLCV)} FROM candles WHERE date || time < ? "
+                "ORDER BY date DESC, time DESC LIMIT ?",
+                conn, params=(first, warmup),
+            ).iloc[::-1]
+        for col in OHLCV[2:]:
+            hist[col] = pd.to_numeric(hist[col], errors="coerce")
+
+        dfx = pd.concat([hist, df_new[OHLCV]], ignore_index=True)
+        dfx["ticker"] = df_new["ticker"].iloc[0]
+        dfx["per"] = df_new["per"].iloc[0]
+        dfx = add_indicators(dfx)
+        if derive is not None:
+            dfx = derive(dfx)
+        dfx = dfx.iloc[len(hist):].copy()
+        for col in columns:
+            if col not in dfx.columns:
+                dfx[col] = df_new[col].to_numpy()
+
+        if has_table:
+            conn.execute("DELETE FROM candles WHERE date || time >= ?", (first,))
+        dfx[columns].to_sql("candles", conn, if_exists="append", index=False)
+        if keep:
+            conn.execute(
+                "DELETE FROM candles WHERE rowid NOT IN "
+                "(SELECT rowid FROM candles ORDER BY date DESC, time DESC LIMIT ?)",
+                (keep,),
+            )
+    return dfx
+
+
+# === Агрегация 1h/1d за один проход по границам групп ===
+HOUR_MS = 3_600_000
+DAY_MS = 86_400_000
+# Дневная свеча начинается в 03:00 МСК (00:00 UTC)
+DAY_OFFSET_MS = 3 * HOUR_MS
+# Правило бакета, его сдвиг и per для старших ТФ
+TF_BUCKETS = {"1h": ("1h", None, "60"), "1d": ("1d", pd.Timedelta(milliseconds=DAY_OFFSET_MS), "1440")}
+
+
+def group_starts(keys) -> np.ndarray:
+    """Индексы начала серий одинаковых ключей в отсортированном массиве."""
+    keys = np.asarray(keys)
+    if not len(keys):
+        return np.empty(0, dtype=np.int64)
+    return np.flatnonzero(np.concatenate([[True], keys[1:] != keys[:-1]]))
+
+
+def _reduce_ohlcv(o, h, l, c, v, starts):
+    if not len(starts):
+        return o[:0], h[:0], l[:0], c[:0], v[:0]
+    ends = np.append(starts[1:], len(o)) - 1
+    return (o[starts], np.maximum.reduceat(h, starts), np.minimum.reduceat(l, starts),
+            c[ends], np.add.reduceat(v, starts))
+
+
+def aggregate_timeframes(ts, ohlcv, cross=None):
+    """1h- и 1d-бары из отсортированных 3m-массивов ts/OHLCV без промежуточных DataFrame.
+
+    Часовые группы находятся по границам ts // 1h (в московском времени), дневные —
+    по границам уже готовых часовых баров со сдвигом +3h. Заодно считаются:
+    density_hma_cross — число ненулевых cross (флаги по 3m) в каждом часе,
+    amp_eff_avg — средняя амплитуда часовых баров за календарную дату дневного бара.
+    Возвращает {"1h": {колонка: массив}, "1d": {...}}, ts — начало бара в epoch-ms.
+    """
+    ts = np.asarray(ts, dtype=np.int64)
+    ohlcv = np.asarray(ohlcv, dtype=np.float64)
+    local = msk_ms(ts)
+
+    hs = group_starts(local // HOUR_MS)
+    hour_local = local[hs] // HOUR_MS * HOUR_MS
+    hour = dict(zip(OHLCV[2:], _reduce_ohlcv(*ohlcv.T, hs)))
+    hour["ts"] = ts[hs] - (local[hs] - hour_local)
+    hour["amplitude"] = 2 * (hour["high"] - hour["low"]) / (hour["high"] + hour["low"]) * 100
+    if cross is not None:
+        flags = (np.asarray(cross) != 0).astype(np.int64)
+        hour["density_hma_cross"] = np.add.reduceat(flags, hs) if len(hs) else flags[:0]
+
+    ds = group_starts((hour_local - DAY_OFFSET_MS) // DAY_MS)
+    day_local = (hour_local[ds] - DAY_OFFSET_MS) // DAY_MS * DAY_MS + DAY_OFFSET_MS
+    day = dict(zip(OHLCV[2:], _reduce_ohlcv(*(hour[col] for col in OHLCV[2:]), ds)))
+    day["ts"] = hour["ts"][ds] - (hour_local[ds] - day_local)
+    day["amplitude"] = 2 * (day["high"] - day["low"]) / (day["high"] + day["low"]) * 100
+
+    # Средняя часовая амплитуда по календарной дате -> дневной бар той же даты
+    cal = hour_local // DAY_MS
+    cs = group_starts(cal)
+    day_cal = day_local // DAY_MS
+    amp_eff = np.full(len(day_cal), np.nan)
+    if len(cs):
+        means = np.add.reduceat(hour["amplitude"], cs) / np.diff(np.append(cs, len(cal)))
+        idx = np.minimum(np.searchsorted(cal[cs], day_cal), len(cs) - 1)
+        found = cal[cs][idx] == day_cal
+        amp_eff[found] = means[idx[found]]
+    day["amp_eff_avg"] = amp_eff
+    return {"1h": hour, "1d": day}
+
+
+def bars_frame(bars, ticker, per):
+    """DataFrame из словаря массивов aggregate_timeframes с колонками date/time."""
+    df = pd.DataFrame({col: values for col, values in bars.items() if col != "ts"})
+    df.insert(0, "ticker", ticker)
+    df.insert(1, "per", per)
+    df["date"], df["time"] = date_time_strings(msk_ms(bars["ts"]))
+    return df
+
+
+def bucket_start(date: str, time: str, rule, offset=None) -> str:
+    """Начало бакета rule (с учётом сдвига offset), в который попадает свеча date+time."""
+    dt = pd.Timestamp(f"{date}{time}")
+    if offset:
+        dt = (dt - offset).floor(rule) + offset
+    else:
+        dt = dt.floor(rule)
+    return dt.strftime("%Y%m%d%H%M%S")
+
+
+# === Инкрементальное обновление 1h/1d ===
+def update_timeframes(path_3m, paths, columns, df_new, derive=None):
+    """Пересобирает в 1h/1d (paths = {tf: путь}) только бакеты, затронутые новыми 3m-свечами.
+
+    Бары собирает aggregate_timeframes, как при полной сборке, вместе с
+    density_hma_cross у 1h и amp_eff_avg у 1d. Из 3m-базы читаются свечи с начала
+    календарной даты дневного бакета первой новой свечи (amp_eff_avg усредняет все
+    часы даты) и одна строка перед ними для флага кросса. HMA и derive[tf]
+    пересчитываются в append_tail по окну прогрева. Возвращает {tf: переписанные строки}.
+    """
+    date, time = df_new["date"].iloc[0], df_new["time"].iloc[0]
+    starts = {}
+    for tf, (rule, offset, _) in TF_BUCKETS.items():
+        starts[tf] = "" if last_saved_ts(paths[tf]) is None else bucket_start(date, time, rule, offset)
+    since = min(starts.values())
+    if since:
+        since = min(since, (pd.Timestamp(starts["1d"]) - TF_BUCKETS["1d"][1]).strftime("%Y%m%d%H%M%S"))
+
+    cols = ", ".join(OHLCV + ["hma9", "hma21"])
+    with sqlite3.connect(path_3m) as conn:
+        prev = pd.read_sql_query(
+            f"SELECT {cols} FROM candles WHERE date || time < ? ORDER BY date DESC, time DESC LIMIT 1",
+            conn, params=(since,),
+        )
+        df = pd.read_sql_query(
+            f"SELECT {cols} FROM candles WHERE date || time >= ? ORDER BY date, time", conn, params=(since,),
+        )
+        oldest = conn.execute("SELECT date, time FROM candles ORDER BY date, time LIMIT 1").fetchone()
+    df = pd.concat([prev, df], ignore_index=True)
+    for col in OHLCV[2:] + ["hma9", "hma21"]:
+        df[col] = pd.to_numeric(df[col], errors="coerce")
+    cross = touch_cross(df["hma9"], df["hma21"]).to_numpy()[len(prev):]
+    df = df.iloc[len(prev):]
+    bars = aggregate_timeframes(
+        epoch_ms(df["date"].to_numpy(), df["time"].to_numpy()), df[OHLCV[2:]].to_numpy(dtype=np.float64), cross
+    )
+
+    tails = {}
+    for tf, (rule, offset, per) in TF_BUCKETS.items():
+        frame = bars_frame(bars[tf], df_new["ticker"].iloc[0], per)
+        frame = frame[frame["date"] + frame["time"] >= starts[tf]].reset_index(drop=True)
+        if frame.empty:
+            tails[tf] = frame
+            continue
+        tails[tf] = append_tail(paths[tf], frame, columns[tf], derive=(derive or {}).get(tf))
+        # История старших ТФ не длиннее 3m-базы
+        with sqlite3.connect(paths[tf]) as conn:
+            conn.execute(
+                "DELETE FROM candles WHERE date || time < ?",
+                (bucket_start(str(oldest[0]), str(oldest[1]), rule, offset),),
+            )
+    return tails
@@ -0,0 +1,228 @@
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from candle_store import (
+    STORE_PATH, VALUE_COLUMNS, read_candles, read_changes, read_cross_counts, read_matrix, read_versions,
+)
+from snapshot import SNAPSHOT_DIR, is_current, load_frame, load_matrix, series_version as snapshot_version
+
+# === Общий кэш данных дашборда ===
+# Один объект на процесс Streamlit (st.cache_resource): все страницы и сессии берут
+# ряды отсюда. Ряд живёт до смены своей версии в хранилище (series_versions),
+# остальное — пока не изменились файлы хранилища и указатель снимка.
+CACHE_SIZE = 256
+# Как часто страница проверяет, не опубликовал ли пайплайн новые версии рядов
+REFRESH_SECONDS = 5
+SERIES_COLUMNS = ["ts"] + VALUE_COLUMNS
+# Окно обзора: поиск последнего кросса и спарклайн амплитуды
+OVERVIEW_WINDOW = 240
+SPARK_POINTS = 48
+OVERVIEW_COLUMNS = ["close", "amplitude", "hma_cross", "zscore_delta", "density_hma_cross"]
+
+
+def _stat(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def data_version(path=STORE_PATH, out=SNAPSHOT_DIR):
+    """Версия данных: (mtime_ns, size) хранилища, его WAL и файла CURRENT снимка."""
+    return _stat(path), _stat(path + "-wal"), _stat(os.path.join(out, "CURRENT"))
+
+
+class DataCache:
+    """Потокобезопасный LRU: ключ -> (версия данных, значение).
+
+    get() возвращает сохранённое значение, только если версия совпадает с текущей,
+    иначе заменяет запись: refresh(старая версия, старое значение), если он передан
+    и запись есть, либо loader(). Сверх maxsize вытесняются самые давние.
+    Значения общие для всех сессий — вызывающий код их не изменяет.
+    """
+    __slots__ = ("maxsize", "hits", "misses", "_items", "_lock")
+
+    def __init__(self, maxsize: int = CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key, loader, version=None, refresh=None):
+        version = data_version() if version is None else version
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None and item[0] == version:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return item[1]
+            self.misses += 1
+        value = refresh(*item) if refresh is not None and item is not None else loader()
+        with self._lock:
+            self._items[key] = (version, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+@st.cache_resource
+def shared_cache():
+    return DataCache(CACHE_SIZE)
+
+
+@st.fragment(run_every=REFRESH_SECONDS)
+def watch_updates(current, held):
+    """Сторож страницы: раз в REFRESH_SECONDS сверяет current() с показанной версией
+    и перезапускает страницу, как только пайплайн опубликовал новые данные."""
+    if current() != held:
+        st.rerun()
+
+
+def msk_datetime(ts):
+    return pd.to_datetime(ts, unit="ms", utc=True).dt.tz_convert("Europe/Moscow").dt.tz_localize(None)
+
+
+def _tidy(df):
+    # Колонки, которых у этого ТФ нет (например, hma9 у 1d), приходят пустыми
+    return df.dropna(axis=1, how="all")
+
+
+# === Версии рядов ===
+def store_versions():
+    """{(ticker, tf): версия} из хранилища; перечитывается, только когда изменились файлы."""
+    return shared_cache().get(("versions",), lambda: read_versions())
+
+
+def series_version(ticker, tf):
+    return store_versions().get((ticker, tf))
+
+
+# === Ряд одного тикера ===
+def _read_series(ticker, tf, since_ts=None):
+    df = read_candles(ticker, tf, SERIES_COLUMNS, since_ts)
+    df["datetime"] = msk_datetime(df["ts"])
+    return df
+
+
+def _refresh_series(ticker, tf, held_version, held):
+    """Догружает ряд от версии held_version: из хранилища читаются только строки с changed_ts."""
+    change = read_changes(ticker, tf, held_version)
+    if change is None:
+        return _tidy(_read_series(ticker, tf))
+    changed_ts, first_ts = change
+    ts = held["ts"].to_numpy()
+    keep = ts >= first_ts if first_ts is not None else np.zeros(len(ts), dtype=bool)
+    if changed_ts is None:
+        return held[keep]
+    keep &= ts < changed_ts
+    return _tidy(pd.concat([held[keep], _read_series(ticker, tf, changed_ts)], ignore_index=True))
+
+
+def _load_series(ticker, tf, version):
+    # Быстрый путь — memmap-снимок; если он отстал от хранилища, дочитываем только хвост
+    df = load_frame(ticker, tf, SERIES_COLUMNS)
+    if df is None:
+        return _tidy(_read_series(ticker, tf))
+    held_version = snapshot_version(ticker, tf)
+    if version is None or held_version == version:
+        return _tidy(df)
+    if held_version is None:
+        return _tidy(_read_series(ticker, tf))
+    return _refresh_series(ticker, tf, held_version, _tidy(df))
+
+
+def load_series(ticker, tf):
+    """Ряд (ticker, tf) из общего кэша.
+
+    Если хранилище публикует версии рядов, запись живёт, пока не сменилась версия
+    именно этого ряда, и обновляется догрузкой хвоста; иначе — до любого изменения файлов.
+    """
+    version = series_version(ticker, tf)
+    if version is None:
+        return shared_cache().get(("series", ticker, tf), lambda: _load_series(ticker, tf, None))
+    return shared_cache().get(
+        ("series", ticker, tf),
+        lambda: _load_series(ticker, tf, version),
+        version,
+        lambda held_version, held: (
+            _refresh_series(ticker, tf, held_version, held) if isinstance(held_version, int)
+            else _load_series(ticker, tf, version)
+        ),
+    )
+
+
+def _load_cross_counts(ticker, period, since, until):
+    counts = read_cross_counts(ticker, period, since, until)
+    counts["datetime"] = msk_datetime(counts["ts"])
+    return counts
+
+
+def load_cross_counts(ticker, period, start, end):
+    """Счётчики кроссов за московские даты [start, end]; фильтр по датам — условие в SQL."""
+    since = pd.Timestamp(start).tz_localize("Europe/Moscow").value // 10**6
+    until = (pd.Timestamp(end) + pd.Timedelta(days=1)).tz_localize("Europe/Moscow").value // 10**6
+    # Счётчики пересобираются из 1h-ряда — его версия и определяет свежесть
+    return shared_cache().get(
+        ("cross_counts", ticker, period, since, until),
+        lambda: _load_cross_counts(ticker, period, since, until),
+        series_version(ticker, "1h"),
+    )
+
+
+# === Обзор всех тикеров ===
+def _last_nonzero(values):
+    """Индекс последнего ненулевого значения в каждой строке или -1."""
+    hit = np.nan_to_num(values) != 0
+    last = values.shape[1] - 1 - np.argmax(hit[:, ::-1], axis=1)
+    return np.where(hit.any(axis=1), last, -1)
+
+
+def _load_overview(tf, window):
+    loaded = load_matrix(tf, OVERVIEW_COLUMNS, window)
+    # Снимок отстал от хранилища (живой режим публикует только в хранилище)
+    if loaded is None or not loaded[0] or not is_current(tf, store_versions()):
+        loaded = read_matrix(tf, OVERVIEW_COLUMNS, window)
+    tickers, m = loaded
+    nan = np.full((len(tickers), window), np.nan)
+    amp = m.get("amplitude", nan)
+    cross = m.get("hma_cross", nan)
+
+    # Значения на последней свече; ряды выровнены по правому краю
+    rows = np.arange(len(tickers))
+    last_cross = _last_nonzero(cross)
+    found = last_cross >= 0
+    side = np.where(found, cross[rows, np.maximum(last_cross, 0)], 0)
+    cross_ts = np.where(found, m["ts"][rows, np.maximum(last_cross, 0)], np.nan)
+    spark = amp[:, -SPARK_POINTS:]
+
+    return pd.DataFrame({
+        "ticker": tickers,
+        "close": m.get("close", nan)[:, -1],
+        "amplitude": [row[~np.isnan(row)].round(4).tolist() for row in spark],
+        "amp_last": amp[:, -1],
+        "cross": np.select([side > 0, side < 0], ["long", "short"], ""),
+        "cross_bars_ago": np.where(found, window - 1 - last_cross, np.nan),
+        "cross_time": msk_datetime(pd.Series(cross_ts)),
+        "zscore_delta": m.get("zscore_delta", nan)[:, -1],
+        "density": m.get("density_hma_cross", nan)[:, -1],
+    })
+
+
+def load_overview(tf, window=OVERVIEW_WINDOW):
+    """Таблица обзора: по строке на тикер, все тикеры ТФ одной выборкой матриц."""
+    return shared_cache().get(("overview", tf, window), lambda: _load_overview(tf, window))
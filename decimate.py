@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+
+# === Прореживание рядов для графиков ===
+# Браузеру нужно не больше точек, чем пикселей по ширине; ~2000 хватает и для 4K.
+MAX_POINTS = 2000
+
+
+def bucket_starts(n: int, max_buckets: int = MAX_POINTS) -> np.ndarray:
+    """Начала подряд идущих групп строк, чтобы групп было не больше max_buckets."""
+    size = max(1, -(-n // max_buckets))
+    return np.arange(0, n, size)
+
+
+def ohlc_buckets(df: pd.DataFrame, max_buckets: int = MAX_POINTS, x="datetime") -> pd.DataFrame:
+    """Свечи, слитые в группы по соседним строкам: open первой, high/low — экстремумы, close последней.
+
+    Время берётся по первой строке группы, amplitude пересчитывается по новым high/low,
+    остальные колонки — по последней строке. Ни один экстремум цены не теряется;
+    короткие ряды возвращаются как есть.
+    """
+    n = len(df)
+    if n <= max_buckets:
+        return df
+    starts = bucket_starts(n, max_buckets)
+    ends = np.append(starts[1:], n) - 1
+    out = df.iloc[ends].reset_index(drop=True)
+    out[x] = df[x].to_numpy()[starts]
+    out["open"] = df["open"].to_numpy()[starts]
+    out["high"] = np.maximum.reduceat(df["high"].to_numpy(dtype=np.float64), starts)
+    out["low"] = np.minimum.reduceat(df["low"].to_numpy(dtype=np.float64), starts)
+    if "vol" in df.columns:
+        out["vol"] = np.add.reduceat(df["vol"].to_numpy(dtype=np.float64), starts)
+    if "amplitude" in df.columns:
+        out["amplitude"] = 2 * (out["high"] - out["low"]) / (out["high"] + out["low"]) * 100
+    return out
+
+
+def lttb(x, y, threshold: int = MAX_POINTS) -> np.ndarray:
+    """Индексы точек по алгоритму Largest-Triangle-Three-Buckets.
+
+    Первая и последняя точки сохраняются, из каждой промежуточной группы берётся
+    точка, образующая наибольший треугольник с выбранной слева и средним справа.
+    NaN в y пропускаются (исключаются до прореживания).
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    valid = np.flatnonzero(~np.isnan(y))
+    n = len(valid)
+    if n <= threshold or threshold < 3:
+        return valid
+    xv, yv = x[valid], y[valid]
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    picked = np.empty(threshold, dtype=np.int64)
+    picked[0], picked[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], edges[i + 1]
+        nxt_lo, nxt_hi = hi, edges[i + 2] if i + 2 < len(edges) else n
+        cx, cy = xv[nxt_lo:nxt_hi].mean(), yv[nxt_lo:nxt_hi].mean()
+        area = np.abs((xv[a] - cx) * (yv[lo:hi] - yv[a]) - (xv[a] - xv[lo:hi]) * (cy - yv[a]))
+        a = lo + int(np.argmax(area))
+        picked[i + 1] = a
+    return valid[picked]
+
+
+def lttb_frame(df: pd.DataFrame, y: str, threshold: int = MAX_POINTS, x="datetime") -> pd.DataFrame:
+    """Строки df, оставленные LTTB по колонке y (ось x — время)."""
+    xs = df[x].to_numpy().astype("datetime64[ms]").astype(np.int64) if np.issubdtype(df[x].dtype, np.datetime64) else df[x]
+    return df.iloc[lttb(xs, df[y], threshold)]
+
+
+def ohlc_hover(df: pd.DataFrame, x="datetime") -> pd.Series:
+    """Текст подсказки для свечей — конкатенацией колонок, без построчного apply."""
+    text = ("Time: " + df[x].astype(str) + "<br>O: " + df["open"].astype(str) + "<br>H: " + df["high"].astype(str)
+            + "<br>L: " + df["low"].astype(str) + "<br>C: " + df["close"].astype(str))
+    if "amplitude" in df.columns:
+        text = text + "<br>Amp: " + df["amplitude"].astype(str)
+    return text
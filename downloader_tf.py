@@ -3,13 +3,15 @@ import re
 import asyncio
 import aiohttp
 import sqlite3
-from datetime import datetime, timedelta
-import pytz
 import requests
 import time
 import sys
 import pandas as pd
 
+from indicators import hma
+from okx_client import TokenBucket, CandleArrays, get_candles
+from candle_sync import candles_frame
+
 # === ПАПКИ ===
 BASE = r"C:\\Users\\777\\PycharmProjects\\Booster4\\scoring_p\\datasets"
 FOLDERS = {
@@ -25,19 +27,6 @@ def clean_folder(path):
         if file.endswith(".sqlite"):
             os.remove(os.path.join(path, file))
 
-# === Индикаторы ===
-def wma(series, period):
-    weights = list(range(1, period + 1))
-    return series.rolling(period).apply(lambda x: sum(w * val for w, val in zip(weights, x)) / sum(weights), raw=True)
-
-def hma(series, period):
-    half = int(period / 2)
-    sqrt_n = int(period ** 0.5)
-    wma_half = wma(series, half)
-    wma_full = wma(series, period)
-    hma_val = 2 * wma_half - wma_full
-    return wma(hma_val, sqrt_n)
-
 tickers_top = [
     "BTC-USDT-SWAP", "ETH-USDT-SWAP", "SOL-USDT-SWAP", "DOGE-USDT-SWAP", "ANIME-USDT-SWAP",
     "PEPE-USDT-SWAP", "XRP-USDT-SWAP", "MASK-USDT-SWAP", "TRUMP-USDT-SWAP", "ADA-USDT-SWAP",
@@ -68,10 +57,6 @@ tickers_top = [
 #     ]
 
 # === Вспомогательные ===
-def from_ts_to_dt(ts: int) -> datetime:
-    dt_utc = datetime.fromtimestamp(ts / 1000, tz=pytz.UTC)
-    return dt_utc.astimezone(pytz.timezone("Europe/Moscow"))
-
 def resample(df, rule, offset=None):
     df["datetime"] = pd.to_datetime(df["date"] + df["time"], format="%Y%m%d%H%M%S")
     df.set_index("datetime", inplace=True)
@@ -98,11 +83,11 @@ def save_to_sqlite(df, tf, ticker):
         df.to_sql("candles", conn, if_exists="replace", index=False)
 
 # === Загрузка и обработка ===
-async def fetch_and_save(session, sem, inst_id, index, total, tf="3m", limit=100, total_candles=3360):
+async def fetch_and_save(session, sem, limiter, inst_id, index, total, tf="3m", limit=100, total_candles=3360):
     async with sem:
         ticker = inst_id.replace("-", "")
         after = ""
-        candles = {}
+        candles = CandleArrays(total_candles + limit)
 
         while len(candles) < total_candles:
             params = {
@@ -112,56 +97,23 @@ async def fetch_and_save(session, sem, inst_id, index, total, tf="3m", limit=100
             }
             if after:
                 params["after"] = after
-            url = "https://www.okx.com/api/v5/market/history-candles"
-
-            max_retries = 2
-            attempt = 0
-            success = False
-            data = []
-            while attempt < max_retries:
-                try:
-                    async with session.get(url, params=params) as resp:
-                        if resp.status != 200:
-                            print(f"\n❌ Ошибка {resp.status} для {inst_id}, попытка {attempt + 1}/{max_retries}")
-                            attempt += 1
-                            await asyncio.sleep(5)
-                            continue
-                        data = (await resp.json()).get("data", [])
-                        success = True
-                        break
-                except Exception as e:
-                    print(f"\n⚠️ Ошибка запроса {inst_id}, попытка {attempt + 1}/{max_retries}: {e}")
-                    attempt += 1
-                    await asyncio.sleep(10)
-
-            if not success or not data:
-                print(f"\n⚠️ Не удалось получить данные для {inst_id} после {max_retries} попыток")
+
+            data = await get_candles(session, limiter, params)
+            if data is None:
+                print(f"\n⚠️ Не удалось получить данные для {inst_id} после всех попыток")
                 return
+            if not data:
+                break  # история закончилась
 
-            for c in data:
-                ts = int(c[0])
-                if ts not in candles:
-                    candles[ts] = {
-                        "ticker": ticker,
-                        "per": "3",
-                        "t": from_ts_to_dt(ts),
-                        "open": float(c[1]),
-                        "high": float(c[2]),
-                        "low": float(c[3]),
-                        "close": float(c[4]),
-                        "vol": float(c[7])
-                    }
+            candles.extend(data)
             after = str(int(data[-1][0]))
-            await asyncio.sleep(0.25)
 
-        if not candles:
+        if not len(candles):
             print(f"\n⚠️ Нет данных для {inst_id}")
             return
 
-        df = pd.DataFrame(sorted(candles.values(), key=lambda x: x["t"]))
-        df["date"] = df["t"].dt.strftime("%Y%m%d")
-        df["time"] = df["t"].dt.strftime("%H%M%S")
-        df.drop(columns=["t"], inplace=True)
+        ts, ohlcv = candles.arrays()
+        df = candles_frame(ts, ohlcv, ticker, "3")
 
         for timeframe, rule, per, offset in [("3m", None, "3", None), ("1h", "1h", "60", None), ("1d", "1d", "1440", pd.Timedelta(hours=3))]:
             dfx = df.copy() if timeframe == "3m" else resample(df.copy(), rule, offset)
@@ -193,8 +145,9 @@ async def main():
     print(f"🔎 Найдено {len(inst_ids)} активных тикеров")
 
     sem = asyncio.Semaphore(5)
+    limiter = TokenBucket.for_endpoint()
     async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=30)) as session:
-        tasks = [fetch_and_save(session, sem, inst_id, i, len(inst_ids)) for i, inst_id in enumerate(inst_ids)]
+        tasks = [fetch_and_save(session, sem, limiter, inst_id, i, len(inst_ids)) for i, inst_id in enumerate(inst_ids)]
         await asyncio.gather(*tasks)
     print("\n✅ Завершено")
 
@@ -0,0 +1,125 @@
+import os
+import hashlib
+import numpy as np
+import pandas as pd
+
+# === Тепловая карта: массив 7×24 (день недели × час) ===
+HEATMAP_PATH = r"C:\Users\777\PycharmProjects\Booster4\WarmMaps\RESULT_HEAT_MAP.xlsx"
+WEEKDAY_NAMES = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
+WEEKDAY_INDEX = {name: i for i, name in enumerate(WEEKDAY_NAMES)}
+
+# Разобранные листы по путям книги: path -> (mtime_ns, size, {тикер: массив 7×24})
+_cache = {}
+
+
+def sheet_to_array(df: pd.DataFrame) -> np.ndarray:
+    """Лист *_H1 (weekday_name + колонки «HH:00») в массив 7×24, пропуски — NaN."""
+    df = df.loc[:, ~df.columns.astype(str).str.contains("Среднее|Медиана")]
+    heatmap = np.full((7, 24), np.nan)
+    hours = {}
+    for col in df.columns[1:]:
+        try:
+            hours[col] = int(str(col)[:2])
+        except ValueError:
+            continue
+    for _, row in df.iterrows():
+        wd = WEEKDAY_INDEX.get(row["weekday_name"])
+        if wd is None:
+            continue
+        for col, hour in hours.items():
+            heatmap[wd, hour] = pd.to_numeric(row[col], errors="coerce")
+    return heatmap
+
+
+# === Кэш всех листов *_H1 ===
+def cache_path_for(path=HEATMAP_PATH):
+    return os.path.splitext(path)[0] + "_H1.npz"
+
+
+def _file_hash(path):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _read_workbook(path):
+    """Все листы *_H1 за одно открытие книги."""
+    xl = pd.ExcelFile(path)
+    sheets = [name for name in xl.sheet_names if name.endswith("_H1")]
+    frames = xl.parse(sheets) if sheets else {}
+    return {name[:-len("_H1")]: sheet_to_array(df) for name, df in frames.items()}
+
+
+def _save_cache(cache_path, heatmaps, mtime_ns, size, digest):
+    tickers = sorted(heatmaps)
+    data = np.stack([heatmaps[t] for t in tickers]) if tickers else np.empty((0, 7, 24))
+    tmp = cache_path + ".tmp.npz"
+    np.savez(tmp, tickers=np.array(tickers, dtype=str), data=data,
+             mtime_ns=np.int64(mtime_ns), size=np.int64(size), sha1=np.array(digest))
+    os.replace(tmp, cache_path)
+
+
+def load_all(path=HEATMAP_PATH):
+    """{тикер: массив 7×24} по всем листам книги.
+
+    Порядок проверки: память -> бинарный кэш рядом с книгой -> разбор Excel.
+    Кэш валиден, пока совпадают mtime и размер книги; если mtime сменился,
+    сверяется sha1 содержимого, и только при расхождении книга разбирается заново.
+    """
+    stat = os.stat(path)
+    mem = _cache.get(path)
+    if mem is not None and mem[:2] == (stat.st_mtime_ns, stat.st_size):
+        return mem[2]
+
+    cache_path = cache_path_for(path)
+    heatmaps, digest = None, None
+    if os.path.exists(cache_path):
+        with np.load(cache_path) as npz:
+            same_stat = int(npz["mtime_ns"]) == stat.st_mtime_ns and int(npz["size"]) == stat.st_size
+            if not same_stat:
+                digest = _file_hash(path)
+            if same_stat or str(npz["sha1"]) == digest:
+                heatmaps = dict(zip(npz["tickers"].tolist(), npz["data"]))
+                cached_digest = str(npz["sha1"])
+        if heatmaps is not None and not same_stat:
+            # Содержимое то же, обновился только mtime — переписываем ключ кэша
+            _save_cache(cache_path, heatmaps, stat.st_mtime_ns, stat.st_size, cached_digest)
+
+    if heatmaps is None:
+        heatmaps = _read_workbook(path)
+        _save_cache(cache_path, heatmaps, stat.st_mtime_ns, stat.st_size, digest or _file_hash(path))
+
+    _cache[path] = (stat.st_mtime_ns, stat.st_size, heatmaps)
+    return heatmaps
+
+
+def load_heatmap(ticker: str, path=HEATMAP_PATH):
+    """Массив 7×24 для тикера или None, если листа нет."""
+    try:
+        return load_all(path).get(ticker)
+    except Exception:
+        return None
+
+
+def weekday_hour(df: pd.DataFrame):
+    """Индексы дня недели и часа для всей колонки сразу; -1 там, где дата не разобралась."""
+    if "ts" in df.columns:
+        dt = pd.to_datetime(df["ts"], unit="ms", utc=True).dt.tz_convert("Europe/Moscow")
+    else:
+        dt = pd.to_datetime(df["date"].astype(str) + df["time"].astype(str), format="%Y%m%d%H%M%S", errors="coerce")
+    valid = dt.notna().to_numpy()
+    wd = np.where(valid, dt.dt.weekday.fillna(0).to_numpy(dtype=np.int64), -1)
+    hr = np.where(valid, dt.dt.hour.fillna(0).to_numpy(dtype=np.int64), -1)
+    return wd, hr
+
+
+def lookup(df: pd.DataFrame, heatmap: np.ndarray):
+    """amp_mean_hist и zscore_delta одной операцией fancy-indexing."""
+    wd, hr = weekday_hour(df)
+    valid = wd >= 0
+    mean = np.full(len(df), np.nan)
+    mean[valid] = heatmap[wd[valid], hr[valid]]
+    amp = pd.to_numeric(df["amplitude"], errors="coerce").to_numpy(dtype=np.float64)
+    return mean, amp - mean
@@ -0,0 +1,343 @@
+import numpy as np
+import pandas as pd
+
+
+# === Индикаторы (векторизованные) ===
+def _wma_values(values: np.ndarray, period: int) -> np.ndarray:
+    """WMA с весами 1..period по массиву float64; первые period-1 значений — NaN.
+
+    Взвешенная сумма набирается срезами в том же порядке, что и прежний
+    rolling().apply(lambda ...), поэтому результат совпадает бит в бит.
+    Окно, содержащее NaN, даёт NaN — как у rolling с min_periods=period.
+    Для 2-D массива (тикер × время) считается по последней оси для всех строк сразу.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    n = values.shape[-1]
+    out = np.full(values.shape, np.nan)
+    if period < 1 or n < period:
+        return out
+    m = n - period + 1
+    acc = np.zeros(values.shape[:-1] + (m,))
+    for k in range(period):
+        acc += (k + 1) * values[..., k:k + m]
+    out[..., period - 1:] = acc / (period * (period + 1) // 2)
+    return out
+
+
+def _hma_values(values: np.ndarray, period: int) -> np.ndarray:
+    half = int(period / 2)
+    sqrt_n = int(period ** 0.5)
+    return _wma_values(2 * _wma_values(values, half) - _wma_values(values, period), sqrt_n)
+
+
+def wma(series, period):
+    if isinstance(series, pd.Series):
+        return pd.Series(_wma_values(series.to_numpy(dtype=np.float64), period), index=series.index, name=series.name)
+    return _wma_values(series, period)
+
+
+def hma(series, period):
+    if isinstance(series, pd.Series):
+        return pd.Series(_hma_values(series.to_numpy(dtype=np.float64), period), index=series.index, name=series.name)
+    return _hma_values(series, period)
+
+
+def touch_cross(hma9, hma21):
+    """Флаги HMA-кросса для плотности: в отличие от hma_cross, касание на предыдущей свече тоже считается."""
+    prev9, prev21 = hma9.shift(1), hma21.shift(1)
+    return ((hma9 > hma21) & (prev9 <= prev21)) | ((hma9 < hma21) & (prev9 >= prev21))
+
+
+def add_indicators(dfx):
+    """Добавляет hma9, hma21, amplitude и hma_cross к кадру со свечами."""
+    dfx["hma9"] = hma(dfx["close"], 9)
+    dfx["hma21"] = hma(dfx["close"], 21)
+    dfx["amplitude"] = 2 * (dfx["high"] - dfx["low"]) / (dfx["high"] + dfx["low"]) * 100
+    dfx["hma_cross"] = 0
+    prev9 = dfx["hma9"].shift(1)
+    prev21 = dfx["hma21"].shift(1)
+    dfx.loc[(prev9 < prev21) & (dfx["hma9"] > dfx["hma21"]), "hma_cross"] = 1
+    dfx.loc[(prev9 > prev21) & (dfx["hma9"] < dfx["hma21"]), "hma_cross"] = -1
+    return dfx
+
+
+# === Потоковые индикаторы (по одной свече) ===
+class StreamingWMA:
+    """WMA на кольцевом буфере: update() принимает одно значение и возвращает текущую WMA.
+
+    Стоимость шага зависит только от period, а не от длины истории; сумма
+    набирается в том же порядке, что и в wma(), поэтому значения совпадают.
+    """
+    __slots__ = ("period", "denom", "buf", "pos", "count")
+
+    def __init__(self, period: int):
+        self.period = period
+        self.denom = period * (period + 1) // 2
+        self.buf = [0.0] * period
+        self.pos = 0
+        self.count = 0
+
+    def update(self, value: float) -> float:
+        buf, period = self.buf, self.period
+        buf[self.pos] = value
+        self.pos = (self.pos + 1) % period
+        if self.count < period:
+            self.count += 1
+            if self.count < period:
+                return np.nan
+        acc = 0.0
+        pos = self.pos
+        for k in range(period):
+            acc += (k + 1) * buf[(pos + k) % period]
+        return acc / self.denom
+
+
+class StreamingHMA:
+    """HMA(period), обновляемая по одному закрытию; хранит текущее и предыдущее значение."""
+    __slots__ = ("period", "_half", "_full", "_smooth", "value", "prev")
+
+    def __init__(self, period: int):
+        self.period = period
+        self._half = StreamingWMA(int(period / 2))
+        self._full = StreamingWMA(period)
+        self._smooth = StreamingWMA(int(period ** 0.5))
+        self.value = np.nan
+        self.prev = np.nan
+
+    @property
+    def warmup(self) -> int:
+        """Сколько закрытий нужно до первого не-NaN значения."""
+        return self.period + self._smooth.period - 1
+
+    def update(self, close: float) -> float:
+        raw = 2 * self._half.update(close) - self._full.update(close)
+        self.prev = self.value
+        self.value = self._smooth.update(raw)
+        return self.value
+
+
+class StreamingHMACross:
+    """Пара HMA(fast)/HMA(slow) с флагом пересечения: 1 — вверх, -1 — вниз, 0 — нет."""
+    __slots__ = ("fast", "slow", "cross")
+
+    def __init__(self, fast: int = 9, slow: int = 21):
+        self.fast = StreamingHMA(fast)
+        self.slow = StreamingHMA(slow)
+        self.cross = 0
+
+    @property
+    def warmup(self) -> int:
+        return max(self.fast.warmup, self.slow.warmup)
+
+    def update(self, close: float) -> int:
+        fast, slow = self.fast, self.slow
+        fast.update(close)
+        slow.update(close)
+        if fast.prev < slow.prev and fast.value > slow.value:
+            self.cross = 1
+        elif fast.prev > slow.prev and fast.value < slow.value:
+            self.cross = -1
+        else:
+            self.cross = 0
+        return self.cross
+
+    @classmethod
+    def from_closes(cls, closes, fast: int = 9, slow: int = 21):
+        """Прогрев по хвосту закрытий: достаточно warmup + 1 последних значений."""
+        state = cls(fast, slow)
+        closes = np.asarray(closes, dtype=np.float64)
+        for close in closes[-(state.warmup + 1):].tolist():
+            state.update(close)
+        return state
+
+
+class StreamingAmplitude:
+    """Амплитуда свечи и её скользящие средние (amp_eff_last3/last6) по одной свече."""
+    __slots__ = ("windows", "value", "means", "_buf", "_pos", "_count")
+
+    def __init__(self, windows=(3, 6)):
+        self.windows = tuple(windows)
+        self.value = np.nan
+        self.means = {w: np.nan for w in self.windows}
+        size = max(self.windows)
+        self._buf = [0.0] * size
+        self._pos = 0
+        self._count = 0
+
+    def update(self, high: float, low: float) -> float:
+        self.value = 2 * (high - low) / (high + low) * 100
+        size = len(self._buf)
+        self._buf[self._pos] = self.value
+        self._pos = (self._pos + 1) % size
+        self._count = min(self._count + 1, size)
+        for w in self.windows:
+            if self._count < w:
+                continue
+            self.means[w] = sum(self._buf[(self._pos - k - 1) % size] for k in range(w)) / w
+        return self.value
+
+    @classmethod
+    def from_arrays(cls, high, low, windows=(3, 6)):
+        """Прогрев по хвосту свечей: хватает max(windows) последних."""
+        state = cls(windows)
+        size = len(state._buf)
+        high, low = (np.asarray(a, dtype=np.float64)[-size:].tolist() for a in (high, low))
+        for h, l in zip(high, low):
+            state.update(h, l)
+        return state
+
+
+# === ATR и всплески объёма: массивы (тикер × время), расчёт по последней оси ===
+def true_range(high, low, close):
+    """True range; у первой свечи предыдущего закрытия нет, поэтому TR = high - low."""
+    high, low, close = (np.asarray(a, dtype=np.float64) for a in (high, low, close))
+    prev_close = np.concatenate([close[..., :1] * np.nan, close[..., :-1]], axis=-1)
+    return np.fmax(high - low, np.fmax(np.abs(high - prev_close), np.abs(low - prev_close)))
+
+
+def rolling_mean(values, window):
+    """Скользящее среднее по последней оси; окно с NaN даёт NaN, как rolling(window).mean()."""
+    values = np.asarray(values, dtype=np.float64)
+    out = np.full(values.shape, np.nan)
+    if values.shape[-1] >= window:
+        out[..., window - 1:] = np.lib.stride_tricks.sliding_window_view(values, window, axis=-1).mean(axis=-1)
+    return out
+
+
+def atr(high, low, close, period=14, method="wilder"):
+    """ATR по всем строкам сразу: "simple" — среднее TR за period, "wilder" — сглаживание Уайлдера.
+
+    Уайлдер стартует со среднего первых period TR строки (для строк, дополненных
+    слева NaN, — с первого полного окна) и дальше ATR = (ATR_prev * (period - 1) + TR) / period.
+    """
+    tr = true_range(high, low, close)
+    simple = rolling_mean(tr, period)
+    if method == "simple":
+        return simple
+    out = np.full(tr.shape, np.nan)
+    state = np.full(tr.shape[:-1], np.nan)
+    for t in range(tr.shape[-1]):
+        smoothed = (state * (period - 1) + tr[..., t]) / period
+        state = np.where(np.isnan(state), simple[..., t], smoothed)
+        out[..., t] = state
+    return out
+
+
+def volume_spike(vol, window=20, ratio=1.5):
+    """vol > ratio × скользящее среднее объёма за window свечей (включая текущую)."""
+    vol = np.asarray(vol, dtype=np.float64)
+    return vol > rolling_mean(vol, window) * ratio
+
+
+class BatchATR:
+    """ATR для вектора тикеров, обновляемый по одной свече на тикер.
+
+    Хранит для каждой строки предыдущее закрытие, кольцевой буфер последних period TR
+    и значение Уайлдера, поэтому шаг update() стоит O(тикеров), а не O(истории).
+    rows — строки, получающие свечу (по умолчанию все): в живом режиме тикеры закрывают
+    бары независимо. peek() — ATR с ещё открытым баром без изменения состояния.
+    """
+    __slots__ = ("period", "method", "prev_close", "value", "_buf", "_pos", "_count")
+
+    def __init__(self, n: int, period: int = 14, method: str = "wilder"):
+        self.period = period
+        self.method = method
+        self.prev_close = np.full(n, np.nan)
+        self.value = np.full(n, np.nan)
+        self._buf = np.full((n, period), np.nan)
+        self._pos = np.zeros(n, dtype=np.int64)
+        self._count = np.zeros(n, dtype=np.int64)
+
+    def _rows(self, rows):
+        return np.arange(len(self.value)) if rows is None else np.atleast_1d(rows)
+
+    def _step(self, rows, high, low, close):
+        high, low, close = (np.asarray(a, dtype=np.float64) for a in (high, low, close))
+        prev = self.prev_close[rows]
+        tr = np.fmax(high - low, np.fmax(np.abs(high - prev), np.abs(low - prev)))
+        buf = self._buf[rows]
+        buf[np.arange(len(rows)), self._pos[rows]] = tr
+        count = np.where(np.isnan(tr), 0, self._count[rows] + 1)
+        simple = np.where(count >= self.period, buf.mean(axis=1), np.nan)
+        if self.method == "simple":
+            return buf, count, simple
+        value = self.value[rows]
+        smoothed = (value * (self.period - 1) + tr) / self.period
+        return buf, count, np.where(np.isnan(value), simple, smoothed)
+
+    def update(self, high, low, close, rows=None) -> np.ndarray:
+        rows = self._rows(rows)
+        self._buf[rows], self._count[rows], self.value[rows] = self._step(rows, high, low, close)
+        self._pos[rows] = (self._pos[rows] + 1) % self.period
+        self.prev_close[rows] = close
+        return self.value
+
+    def peek(self, high, low, close, rows=None) -> np.ndarray:
+        rows = self._rows(rows)
+        return self._step(rows, high, low, close)[2]
+
+    def reset(self, rows=None):
+        rows = self._rows(rows)
+        self.prev_close[rows] = np.nan
+        self.value[rows] = np.nan
+        self._buf[rows] = np.nan
+        self._pos[rows] = 0
+        self._count[rows] = 0
+
+    @classmethod
+    def from_arrays(cls, high, low, close, period: int = 14, method: str = "wilder"):
+        """Прогрев по 2-D истории (тикер × время); value совпадает с atr()[:, -1] с точностью до округления."""
+        high, low, close = (np.asarray(a, dtype=np.float64) for a in (high, low, close))
+        state = cls(high.shape[0], period, method)
+        for t in range(high.shape[1]):
+            state.update(high[:, t], low[:, t], close[:, t])
+        return state
+
+
+class BatchVolumeSpike:
+    """Флаг всплеска объёма для вектора тикеров с кольцевым буфером последних window объёмов на строку."""
+    __slots__ = ("window", "ratio", "flag", "_buf", "_pos", "_count")
+
+    def __init__(self, n: int, window: int = 20, ratio: float = 1.5):
+        self.window = window
+        self.ratio = ratio
+        self.flag = np.zeros(n, dtype=bool)
+        self._buf = np.full((n, window), np.nan)
+        self._pos = np.zeros(n, dtype=np.int64)
+        self._count = np.zeros(n, dtype=np.int64)
+
+    def _rows(self, rows):
+        return np.arange(len(self.flag)) if rows is None else np.atleast_1d(rows)
+
+    def _step(self, rows, vol):
+        vol = np.asarray(vol, dtype=np.float64)
+        buf = self._buf[rows]
+        buf[np.arange(len(rows)), self._pos[rows]] = vol
+        count = np.where(np.isnan(vol), 0, self._count[rows] + 1)
+        mean = np.where(count >= self.window, buf.mean(axis=1), np.nan)
+        return buf, count, vol > mean * self.ratio
+
+    def update(self, vol, rows=None) -> np.ndarray:
+        rows = self._rows(rows)
+        self._buf[rows], self._count[rows], self.flag[rows] = self._step(rows, vol)
+        self._pos[rows] = (self._pos[rows] + 1) % self.window
+        return self.flag
+
+    def peek(self, vol, rows=None) -> np.ndarray:
+        rows = self._rows(rows)
+        return self._step(rows, vol)[2]
+
+    def reset(self, rows=None):
+        rows = self._rows(rows)
+        self.flag[rows] = False
+        self._buf[rows] = np.nan
+        self._pos[rows] = 0
+        self._count[rows] = 0
+
+    @classmethod
+    def from_arrays(cls, vol, window: int = 20, ratio: float = 1.5):
+        vol = np.asarray(vol, dtype=np.float64)
+        state = cls(vol.shape[0], window, ratio)
+        for t in range(vol.shape[1]):
+            state.update(vol[:, t])
+        return state
@@ -0,0 +1,246 @@
+import json
+import time
+import random
+import asyncio
+import aiohttp
+import numpy as np
+
+# === OKX REST: лимиты и повторы ===
+OKX_BASE_URL = "https://www.okx.com"
+HISTORY_CANDLES = "/api/v5/market/history-candles"
+# Документированные лимиты OKX: (запросов, за секунд) на IP для эндпоинта
+RATE_LIMITS = {
+    HISTORY_CANDLES: (20, 2.0),
+}
+# Коды ответа OKX «слишком много запросов»
+RATE_LIMIT_CODES = {"50011", "50061"}
+MAX_ATTEMPTS = 5
+# Минимальная общая пауза после отказа по лимиту (окно OKX — 2 секунды)
+RATE_LIMIT_PAUSE = 1.0
+
+
+class TokenBucket:
+    """Общий для всех корутин лимитер запросов: скорость rate в секунду, запас burst.
+
+    В любом окне длиной per секунд проходит не больше burst + rate * per запросов,
+    поэтому for_endpoint() подбирает rate так, чтобы эта сумма равнялась лимиту OKX.
+    На 429/коде лимита скорость режется вдвое и все ждут паузу (penalize),
+    после каждого успешного ответа скорость понемногу возвращается к номиналу (reward).
+    """
+    __slots__ = ("burst", "max_rate", "rate", "tokens", "updated", "blocked_until", "_lock")
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.burst = burst
+        self.max_rate = rate
+        self.rate = rate
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    @classmethod
+    def for_endpoint(cls, endpoint: str = HISTORY_CANDLES, burst: int = 1):
+        limit, per = RATE_LIMITS[endpoint]
+        return cls((limit - burst) / per, burst)
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def penalize(self, delay: float):
+        self.rate = max(self.max_rate / 8, self.rate / 2)
+        self.tokens = 0.0
+        self.blocked_until = max(self.blocked_until, time.monotonic() + delay)
+
+    def reward(self):
+        self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+
+def backoff_delay(attempt: int, base: float = 0.5, cap: float = 10.0) -> float:
+    """Экспоненциальная пауза с «полным» джиттером, не больше cap."""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+async def get_candles(session, limiter, params, base_url=None, max_attempts=MAX_ATTEMPTS):
+    """Одна страница history-candles.
+
+    Возвращает список свечей ([] — история закончилась) или None, если все попытки
+    исчерпаны. Перед каждым запросом берётся токен из общего лимитера.
+    """
+    url = (base_url or OKX_BASE_URL) + HISTORY_CANDLES
+    for attempt in range(max_attempts):
+        await limiter.acquire()
+        try:
+            async with session.get(url, params=params) as resp:
+                if resp.status == 429:
+                    limiter.penalize(RATE_LIMIT_PAUSE + backoff_delay(attempt))
+                    continue
+                if resp.status != 200:
+                    await asyncio.sleep(backoff_delay(attempt))
+                    continue
+                payload = await resp.json()
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+            await asyncio.sleep(backoff_delay(attempt))
+            continue
+
+        code = str(payload.get("code", "0"))
+        if code in RATE_LIMIT_CODES:
+            limiter.penalize(RATE_LIMIT_PAUSE + backoff_delay(attempt))
+            continue
+        if code != "0":
+            await asyncio.sleep(backoff_delay(attempt))
+            continue
+        limiter.reward()
+        return payload.get("data", [])
+    return None
+
+
+# === Накопление свечей в массивах ===
+class CandleArrays:
+    """Сырые свечи OKX в предвыделенных массивах: ts (int64) и open/high/low/close/vol (float64).
+
+    Страница разбирается одним np.array без промежуточных dict; дубликаты по ts
+    убираются один раз в arrays(). При нехватке места массивы удваиваются.
+    """
+    __slots__ = ("ts", "ohlcv", "n")
+
+    # Колонки сырой строки OKX: ts, o, h, l, c, vol, volCcy, volCcyQuote, confirm
+    OHLCV_FIELDS = [1, 2, 3, 4, 7]
+
+    def __init__(self, capacity: int = 1024):
+        self.ts = np.empty(capacity, dtype=np.int64)
+        self.ohlcv = np.empty((capacity, 5), dtype=np.float64)
+        self.n = 0
+
+    def __len__(self):
+        return self.n
+
+    def extend(self, data, start_ts=None, end_ts=None):
+        """Добавляет страницу OKX, отбрасывая свечи вне [start_ts, end_ts)."""
+        if not data:
+            return
+        page = np.array(data)
+        ts = page[:, 0].astype(np.int64)
+        keep = np.ones(len(ts), dtype=bool)
+        if start_ts is not None:
+            keep &= ts >= start_ts
+        if end_ts is not None:
+            keep &= ts < end_ts
+        k = int(keep.sum())
+        if not k:
+            return
+        if self.n + k > len(self.ts):
+            capacity = max(2 * len(self.ts), self.n + k)
+            self.ts = np.resize(self.ts, capacity)
+            self.ohlcv = np.resize(self.ohlcv, (capacity, 5))
+        self.ts[self.n:self.n + k] = ts[keep]
+        self.ohlcv[self.n:self.n + k] = page[keep][:, self.OHLCV_FIELDS].astype(np.float64)
+        self.n += k
+
+    def arrays(self):
+        """(ts, ohlcv) по возрастанию ts без дубликатов (остаётся первая загруженная свеча)."""
+        ts, first = np.unique(self.ts[:self.n], return_index=True)
+        return ts, self.ohlcv[first]
+
+
+# === Загрузка диапазона и шардирование по времени ===
+BAR_MS = {"1m": 60_000, "3m": 180_000, "5m": 300_000, "15m": 900_000, "1H": 3_600_000, "1D": 86_400_000}
+
+
+async def fetch_range(session, limiter, inst_id, bar, start_ts, end_ts, limit=100, out=None, base_url=None):
+    """Свечи с start_ts <= ts < end_ts: листаем курсором after от end_ts назад.
+
+    Свечи дописываются в out (CandleArrays). Возвращает (out, ok); ok=False —
+    OKX так и не ответил, и в out только то, что успели загрузить.
+    base_url — другой адрес REST (тестовый сервер), по умолчанию OKX.
+    """
+    if out is None:
+        out = CandleArrays(-(-(end_ts - start_ts) // BAR_MS[bar]) + limit)
+    after = end_ts
+    while after > start_ts:
+        params = {"instId": inst_id, "bar": bar, "limit": str(limit),
+                  "after": str(after), "before": str(start_ts - 1)}
+        data = await get_candles(session, limiter, params, base_url)
+        if data is None:
+            return out, False
+        if not data:
+            break  # история закончилась
+        out.extend(data, start_ts, end_ts)
+        oldest = int(data[-1][0])
+        if oldest >= after:
+            break
+        after = oldest
+    return out, True
+
+
+async def fetch_sharded(session, limiter, inst_id, bar, start_ts, end_ts, shards=1, limit=100, base_url=None):
+    """Делит [start_ts, end_ts) на непересекающиеся окна и качает их параллельно.
+
+    Окна выровнены по длине бара и не короче одной страницы (limit баров), общий
+    темп по-прежнему держит limiter. Все окна пишут в один CandleArrays.
+    """
+    bar_ms = BAR_MS[bar]
+    span_bars = max(1, -(-(end_ts - start_ts) // bar_ms))
+    shards = max(1, min(shards, -(-span_bars // limit)))
+    step = -(-span_bars // shards) * bar_ms
+    bounds = [(max(start_ts, end_ts - (i + 1) * step), end_ts - i * step) for i in range(shards)]
+    out = CandleArrays(span_bars + limit)
+    results = await asyncio.gather(*[
+        fetch_range(session, limiter, inst_id, bar, lo, hi, limit, out, base_url) for lo, hi in bounds if hi > lo
+    ])
+    return out, all(ok for _, ok in results)
+
+
+# === WebSocket: закрытые свечи в реальном времени ===
+OKX_WS_URL = "wss://ws.okx.com:8443/ws/v5/business"
+# OKX рвёт соединение после 30 секунд тишины — шлём "ping" раньше
+WS_PING_INTERVAL = 25.0
+
+
+async def stream_candles(session, inst_ids, bar="3m", url=None):
+    """Асинхронный генератор закрытых свечей: (inst_id, сырая строка OKX).
+
+    Все инструменты подписываются на канал candle<bar> по одному соединению.
+    Незакрытые обновления (confirm != "1") пропускаются. При обрыве генератор
+    переподключается с экспоненциальной паузой; пропущенные за это время бары
+    догружает вызывающий код через REST.
+    """
+    subscribe = {"op": "subscribe", "args": [{"channel": f"candle{bar}", "instId": i} for i in inst_ids]}
+    attempt = 0
+    while True:
+        try:
+            async with session.ws_connect(url or OKX_WS_URL, heartbeat=None) as ws:
+                await ws.send_json(subscribe)
+                attempt = 0
+                while True:
+                    try:
+                        msg = await ws.receive(timeout=WS_PING_INTERVAL)
+                    except asyncio.TimeoutError:
+                        await ws.send_str("ping")
+                        continue
+                    if msg.type != aiohttp.WSMsgType.TEXT:
+                        break  # соединение закрыто или ошибка
+                    if msg.data == "pong":
+                        continue
+                    payload = json.loads(msg.data)
+                    if payload.get("event") == "error":
+                        print(f"\n⚠️ OKX WebSocket: {payload.get('code')} {payload.get('msg')}")
+                        continue
+                    inst_id = payload.get("arg", {}).get("instId")
+                    for row in payload.get("data", []):
+                        if len(row) > 8 and row[8] == "1":
+                            yield inst_id, row
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            print(f"\n⚠️ OKX WebSocket: соединение потеряно ({e!r})")
+        await asyncio.sleep(backoff_delay(attempt))
+        attempt += 1
@@ -1,9 +1,15 @@
 import os
 import sqlite3
+import argparse
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
 import numpy as np
 from tqdm import tqdm
 
+from candle_store import epoch_ms
+from candle_sync import OHLCV, aggregate_timeframes
+from sqlite_writer import write_table
+
 # === Параметры ===
 TF_PARAMS = {
     "3mtf": {
@@ -35,123 +41,148 @@ def compute_hma_cross(df):
     return cross.astype(int)
 
 
-def process_3mtf():
+def rolling_cross_density(cross_flags, times, window, start_minute):
+    """Число кроссов в window предыдущих свечах (без текущей) через разность кумулятивных сумм.
+
+    Значение ставится только там, где последние два символа времени равны start_minute,
+    в остальных строках — NaN.
+    """
+    flags = np.asarray(cross_flags, dtype=np.int64)
+    csum = np.concatenate([[0], np.cumsum(flags)])
+    idx = np.arange(len(flags))
+    counts = pd.Series(csum[idx] - csum[np.maximum(0, idx - window)], index=cross_flags.index)
+    mask = times.astype(str).str[-2:] == start_minute
+    return counts.where(mask)
+
+
+# === Запуск по файлам: последовательно или в пуле процессов ===
+def run_per_file(func, files, desc, workers=1):
+    """Вызывает func(file) для каждого файла; при workers > 1 — в ProcessPoolExecutor.
+
+    Прогресс идёт в порядке списка files, ошибка одного тикера не останавливает
+    остальные — все ошибки печатаются в конце и возвращаются словарём {file: exception}.
+    """
+    errors = {}
+    if workers <= 1:
+        for file in tqdm(files, desc=desc):
+            try:
+                func(file)
+            except Exception as e:
+                errors[file] = e
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(func, file) for file in files]
+            for file, future in tqdm(zip(files, futures), total=len(files), desc=desc):
+                try:
+                    future.result()
+                except Exception as e:
+                    errors[file] = e
+    for file, e in errors.items():
+        print(f"\n❌ {desc}: ошибка в {file}: {e}")
+    return errors
+
+
+def sqlite_files(folder):
+    return [f for f in os.listdir(folder) if f.endswith(".sqlite")]
+
+
+def density_3mtf_file(file):
     p = TF_PARAMS["3mtf"]
-    for file in tqdm(os.listdir(p["folder"]), desc="3mtf"):
-        if not file.endswith(".sqlite"):
-            continue
-        path = os.path.join(p["folder"], file)
-        con = sqlite3.connect(path)
+    path = os.path.join(p["folder"], file)
+    with sqlite3.connect(path) as con:
         df = pd.read_sql_query("SELECT * FROM candles", con)
-        df.columns = [col.lower().strip() for col in df.columns]
-
-        cross_flags = compute_hma_cross(df)
-        density = []
-        for i in range(len(df)):
-            if str(df.loc[i, p["time_column"].lower()])[-2:] == p["start_minute"]:
-                window_crosses = cross_flags[max(0, i - p["window"]):i].sum()
-                density.append(window_crosses)
-            else:
-                density.append(np.nan)
-
-        df["density_hma_cross"] = density
-        df.to_sql("candles", con, if_exists="replace", index=False)
-        con.close()
+    df.columns = [col.lower().strip() for col in df.columns]
 
+    df["density_hma_cross"] = rolling_cross_density(
+        compute_hma_cross(df), df[p["time_column"].lower()], p["window"], p["start_minute"]
+    )
+    write_table(path, df)
 
-def process_1htf():
-    p = TF_PARAMS["1htf"]
-    folder_3m = TF_PARAMS["3mtf"]["folder"]
 
-    for file in tqdm(os.listdir(p["folder"]), desc="1htf"):
-        if not file.endswith(".sqlite"):
-            continue
+def process_3mtf(workers=1):
+    p = TF_PARAMS["3mtf"]
+    return run_per_file(density_3mtf_file, sqlite_files(p["folder"]), "3mtf", workers)
 
-        base_name = file.replace("_1h.sqlite", "")
-        path_1h = os.path.join(p["folder"], file)
-        path_3m = os.path.join(folder_3m, base_name + "_3m.sqlite")
 
-        if not os.path.exists(path_3m):
-            continue
+def read_3m_arrays(path_3m):
+    """3m-свечи файла как массивы для aggregate_timeframes: ts, OHLCV и флаги HMA-кросса."""
+    with sqlite3.connect(path_3m) as con:
+        df = pd.read_sql_query("SELECT * FROM candles ORDER BY date, time", con)
+    df.columns = [col.lower().strip() for col in df.columns]
+    ts = epoch_ms(df["date"].to_numpy(), df["time"].to_numpy())
+    ohlcv = df[OHLCV[2:]].apply(pd.to_numeric, errors="coerce").to_numpy(dtype=np.float64)
+    cross = compute_hma_cross(df).to_numpy() if "hma9" in df.columns else None
+    return ts, ohlcv, cross
 
-        con_1h = sqlite3.connect(path_1h)
-        con_3m = sqlite3.connect(path_3m)
 
-        df_1h = pd.read_sql_query("SELECT * FROM candles", con_1h)
-        df_3m = pd.read_sql_query("SELECT * FROM candles", con_3m)
+def by_bar_ts(df, bars, column):
+    """Значения bars[column] для строк df, сопоставленные по началу бара (epoch-ms)."""
+    values = pd.Series(bars[column], index=bars["ts"])
+    return values.reindex(epoch_ms(df["date"].to_numpy(), df["time"].to_numpy())).to_numpy()
 
-        df_1h.columns = [col.lower().strip() for col in df_1h.columns]
-        df_3m.columns = [col.lower().strip() for col in df_3m.columns]
 
-        df_3m["hma_cross"] = compute_hma_cross(df_3m)
+def density_1htf_file(file):
+    p = TF_PARAMS["1htf"]
+    folder_3m = TF_PARAMS["3mtf"]["folder"]
 
-        # Часовой ключ: YYYYMMDDHH
-        df_3m["datetime"] = pd.to_datetime(df_3m["date"] + df_3m["time"], format="%Y%m%d%H%M%S")
-        df_3m["hour_key"] = df_3m["datetime"].dt.strftime("%Y%m%d%H")
-        df_3m["minute"] = df_3m["datetime"].dt.minute
+    base_name = file.replace("_1h.sqlite", "")
+    path_1h = os.path.join(p["folder"], file)
+    path_3m = os.path.join(folder_3m, base_name + "_3m.sqlite")
 
-        # Фильтруем на начало каждого часа (MM == 00)
-        df_hourly = df_3m[df_3m["minute"] == 0]
-        density = df_3m[df_3m["hma_cross"] != 0].groupby("hour_key").size()
+    if not os.path.exists(path_3m):
+        return
 
-        df_1h["datetime"] = pd.to_datetime(df_1h["date"] + df_1h["time"], format="%Y%m%d%H%M%S")
-        df_1h["hour_key"] = df_1h["datetime"].dt.strftime("%Y%m%d%H")
-        df_1h["density_hma_cross"] = df_1h["hour_key"].map(density).fillna(0).astype(int)
+    # Число кроссов 3m в каждом часе — из тех же групп, что и часовые бары
+    bars = aggregate_timeframes(*read_3m_arrays(path_3m))["1h"]
 
-        df_1h.drop(columns=["datetime", "hour_key"], inplace=True)
-        df_1h.to_sql("candles", con_1h, if_exists="replace", index=False)
+    with sqlite3.connect(path_1h) as con_1h:
+        df_1h = pd.read_sql_query("SELECT * FROM candles", con_1h)
+    df_1h.columns = [col.lower().strip() for col in df_1h.columns]
+    density = by_bar_ts(df_1h, bars, "density_hma_cross")
+    df_1h["density_hma_cross"] = np.nan_to_num(density).astype(int)
+    write_table(path_1h, df_1h)
 
-        con_1h.close()
-        con_3m.close()
 
+def process_1htf(workers=1):
+    p = TF_PARAMS["1htf"]
+    return run_per_file(density_1htf_file, sqlite_files(p["folder"]), "1htf", workers)
 
 
-def process_1dtf():
+def amp_eff_1dtf_file(file):
     p = TF_PARAMS["1dtf"]
     folder = p["folder"]
-    folder_1h = TF_PARAMS["1htf"]["folder"]
-
-    for file in tqdm(os.listdir(folder), desc="1dtf"):
-        if not file.endswith(".sqlite"):
-            continue
 
-        path_1d = os.path.join(folder, file)
-        base_name = file.replace("_1d.sqlite", "")
-        path_1h = os.path.join(folder_1h, base_name + "_1h.sqlite")
+    path_1d = os.path.join(folder, file)
+    base_name = file.replace("_1d.sqlite", "")
+    path_3m = os.path.join(p["source_3mtf"], base_name + "_3m.sqlite")
 
-        if not os.path.exists(path_1h):
-            continue
+    if not os.path.exists(path_3m):
+        return
 
-        # === Загрузка дневных и часовых свечей ===
-        con_day = sqlite3.connect(path_1d)
-        con_hour = sqlite3.connect(path_1h)
+    # === Средняя часовая амплитуда за дату — из 3m без чтения часовой базы ===
+    bars = aggregate_timeframes(*read_3m_arrays(path_3m)[:2])["1d"]
 
+    with sqlite3.connect(path_1d) as con_day:
         df_day = pd.read_sql_query("SELECT * FROM candles", con_day)
-        df_hour = pd.read_sql_query("SELECT * FROM candles", con_hour)
 
-        con_day.close()
-        con_hour.close()
+    # === Очистка HMA-столбцов ===
+    for col in ["hma9", "hma21", "hma_cross"]:
+        if col in df_day.columns:
+            df_day.drop(columns=[col], inplace=True)
 
-        # === Очистка HMA-столбцов ===
-        for col in ["hma9", "hma21", "hma_cross"]:
-            if col in df_day.columns:
-                df_day.drop(columns=[col], inplace=True)
+    df_day["amp_eff_avg"] = by_bar_ts(df_day, bars, "amp_eff_avg")
+    write_table(path_1d, df_day)
 
-        # === Расчёт amp_eff_avg по дневной дате ===
-        df_hour.columns = [c.lower().strip() for c in df_hour.columns]
-        df_hour["date"] = df_hour["date"].astype(str)
-        df_hour["amp_eff"] = pd.to_numeric(df_hour.get("amplitude"), errors="coerce")
 
-        amp_eff_by_date = df_hour.groupby("date")["amp_eff"].mean().to_dict()
-        df_day["amp_eff_avg"] = df_day["date"].astype(str).map(amp_eff_by_date)
-
-        # === Сохранение обратно ===
-        con_day = sqlite3.connect(path_1d)
-        df_day.to_sql("candles", con_day, if_exists="replace", index=False)
-        con_day.close()
+def process_1dtf(workers=1):
+    p = TF_PARAMS["1dtf"]
+    return run_per_file(amp_eff_1dtf_file, sqlite_files(p["folder"]), "1dtf", workers)
 
 
 if __name__ == "__main__":
-    process_3mtf()
-    process_1htf()
-    process_1dtf()
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=1, help="число процессов для обработки тикеров")
+    args = parser.parse_args()
+    process_3mtf(args.workers)
+    process_1htf(args.workers)
+    process_1dtf(args.workers)
@@ -0,0 +1,53 @@
+import streamlit as st
+
+from dashboard_cache import SPARK_POINTS, data_version, load_overview, shared_cache, watch_updates
+
+# Настройки страницы
+st.set_page_config(page_title="Обзор тикеров", layout="wide")
+st.header("📋 Обзор всех тикеров")
+
+TF_LIST = ["3m", "1h", "1d"]
+
+# Таблица собирается один раз на версию данных; фильтры ниже работают по готовому кадру
+tf = st.sidebar.selectbox("Таймфрейм", TF_LIST, index=1)
+version = data_version()
+overview = load_overview(tf)
+watch_updates(data_version, version)
+
+# Фильтры
+st.sidebar.markdown("### 🔎 Фильтры")
+query = st.sidebar.text_input("Тикер содержит", "").strip().upper()
+sides = st.sidebar.multiselect(
+    "Последний HMA_cross", ["long", "short", ""], default=["long", "short", ""],
+    format_func=lambda side: side or "нет в окне",
+)
+max_ago = st.sidebar.number_input("Кросс не старше, свечей", min_value=0, value=0, help="0 — без ограничения")
+
+mask = overview["cross"].isin(sides)
+if query:
+    mask &= overview["ticker"].str.contains(query, regex=False)
+if max_ago:
+    mask &= overview["cross_bars_ago"] <= max_ago
+view = overview[mask]
+
+cache = shared_cache()
+st.caption(f"{len(view)} из {len(overview)} тикеров · кэш: {len(cache)} записей, попаданий {cache.hits}, промахов {cache.misses}")
+
+# Сортировка — кликом по заголовку колонки
+st.dataframe(
+    view,
+    hide_index=True,
+    use_container_width=True,
+    height=min(38 + 35 * len(view), 2000),
+    column_config={
+        "ticker": st.column_config.TextColumn("Тикер"),
+        "close": st.column_config.NumberColumn("Close", format="%.6g"),
+        "amplitude": st.column_config.LineChartColumn(f"Amplitude, {SPARK_POINTS} свечей"),
+        "amp_last": st.column_config.NumberColumn("Amp", format="%.3f"),
+        "cross": st.column_config.TextColumn("HMA_cross"),
+        "cross_bars_ago": st.column_config.NumberColumn("Свечей назад", format="%d"),
+        "cross_time": st.column_config.DatetimeColumn("Время кросса", format="DD.MM.YY HH:mm"),
+        "zscore_delta": st.column_config.NumberColumn("zscore_delta", format="%.3f"),
+        "density": st.column_config.NumberColumn("Плотность", format="%d"),
+    },
+)
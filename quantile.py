@@ -1,20 +1,17 @@
-import sqlite3
 from pathlib import Path
 import pandas as pd
 
-# Путь к директории с SQLite-файлами
-ONEH_DIR = Path(r"C:\Users\777\PycharmProjects\Booster4\scoring_p\datasets\1htf")
+from candle_store import read_column
+
+# Одна колонка amp_eff_last3 по всем тикерам 1h — один индексный запрос к хранилищу
+df_amp = read_column("1h", "amp_eff_last3")
 
 results = []
-for db_file in ONEH_DIR.glob("*_1h.sqlite"):
-    # сначала вытаскиваем имя, убираем _1h, потом убираем суффикс USDTSWAP
-    raw = db_file.stem.replace("_1h", "")
+for raw, df in df_amp.groupby("ticker", sort=False):
+    # убираем суффикс USDTSWAP
     ticker = raw.removesuffix("USDTSWAP")
 
-    with sqlite3.connect(db_file) as conn:
-        df = pd.read_sql_query("SELECT amp_eff_last3 FROM candles", conn)
-
-    s = pd.to_numeric(df['amp_eff_last3'], errors='coerce').dropna().iloc[3:]
+    s = df['amp_eff_last3'].dropna().iloc[3:]
     q1, med, q3, q90 = s.quantile([0.25, 0.50, 0.75, 0.90])
 
     results.append({
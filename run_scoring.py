@@ -1,167 +1,216 @@
-import os
-import pandas as pd
+import time
+import argparse
 import numpy as np
-from datetime import datetime
-import pytz
 import pandas as pd
 
-def calculate_hma(series: pd.Series, period: int) -> pd.Series:
-    """Вычисление Hull Moving Average"""
-    half_length = int(period / 2)
-    sqrt_length = int(period ** 0.5)
-
-    wma_half = series.rolling(window=half_length).mean()
-    wma_full = series.rolling(window=period).mean()
-
-    hma = 2 * wma_half - wma_full
-    hma = hma.rolling(window=sqrt_length).mean()
-    return hma
-
-# === Индикаторы ===
-def calc_hma(series: pd.Series, period: int) -> pd.Series:
-    wma = lambda s, p: s.rolling(p).apply(lambda x: np.average(x, weights=np.arange(1, p+1)), raw=True)
-    half = int(period / 2)
-    sqrt_len = int(np.sqrt(period))
-    return wma(2 * wma(series, half) - wma(series, period), sqrt_len)
-
-def detect_hma_cross(df: pd.DataFrame) -> str:
-    hma9 = calc_hma(df['close'].astype(float), 9)
-    hma21 = calc_hma(df['close'].astype(float), 21)
-    if hma9.iloc[-2] < hma21.iloc[-2] and hma9.iloc[-1] > hma21.iloc[-1]:
-        return 'long'
-    elif hma9.iloc[-2] > hma21.iloc[-2] and hma9.iloc[-1] < hma21.iloc[-1]:
-        return 'short'
-    return ''
-
-def compute_atr(df: pd.DataFrame, period: int) -> pd.Series:
-    high = df['high'].astype(float)
-    low = df['low'].astype(float)
-    close = df['close'].astype(float)
-    tr = pd.concat([
-        high - low,
-        (high - close.shift()).abs(),
-        (low - close.shift()).abs()
-    ], axis=1).max(axis=1)
-    return tr.rolling(period).mean()
-
-def get_volume_spike_flag(df: pd.DataFrame) -> bool:
-    vol = df['volume'].astype(float)
-    return vol.iloc[-1] > vol.rolling(20).mean().iloc[-1] * 1.5
-
-def check_cross_confluence(df_3m: pd.DataFrame, df_1h: pd.DataFrame) -> bool:
-    return detect_hma_cross(df_3m) == detect_hma_cross(df_1h)
-
-# === Загрузка данных по тикеру ===
-
-def load_ticker_data(data_dir, symbol):
+from indicators import hma, atr, volume_spike, BatchATR, BatchVolumeSpike
+from heatmap import load_all, weekday_hour
+from candle_store import epoch_ms, read_matrix, read_versions
+from snapshot import is_current, load_matrix
+
+# === Параметры скоринга ===
+# HMA(21) нужно 24 закрытия, ATR и средний объём — по 21/20 свечей; берём с запасом
+WINDOWS = {"3m": 64, "1h": 32, "1d": 32}
+# ATR и всплеск объёма по всем ТФ. 3360 3m-свечей — это ~8 дневных, меньше ATR_PERIOD
+# и окна объёма, поэтому atr_pct_1d остаётся NaN, а vol_spike_1d — False, пока история
+# 3m-баз короче ATR_PERIOD суток
+FEATURE_TFS = ["3m", "1h", "1d"]
+FEATURE_COLUMNS = ["ts", "high", "low", "close", "vol"]
+ATR_PERIOD = 21
+ATR_METHOD = "simple"
+VOLUME_SPIKE_WINDOW = 20
+VOLUME_SPIKE_RATIO = 1.5
+MIN_VOL = {"3m": 50_000, "1h": 500_000, "1d": 2_000_000}
+TOP_N = 10
+
+
+# === Загрузка: все тикеры сразу, 2-D массивы (тикер × время) ===
+def load_window(tf, columns, window):
+    """Сначала бинарный снимок; если его нет или он отстал от хранилища — единое хранилище."""
+    loaded = load_matrix(tf, columns, window)
+    if loaded is None or not loaded[0] or not is_current(tf, read_versions()):
+        loaded = read_matrix(tf, columns, window)
+    return loaded
+
+
+def align(loaded, tickers):
+    """Строки матриц другого ТФ в порядке tickers; отсутствующие тикеры — NaN."""
+    other, matrix = loaded
+    rows = pd.Index(other).get_indexer(tickers)
+    found = rows >= 0
+    out = {}
+    for col, arr in matrix.items():
+        aligned = np.full((len(tickers), arr.shape[1]), np.nan)
+        aligned[found] = arr[rows[found]]
+        out[col] = aligned
+    return out
+
+
+# === Индикаторы по последней свече для всех тикеров ===
+def hma_cross_last(close):
+    """1 / -1 / 0: пересечение HMA(9) и HMA(21) на последней свече каждой строки."""
+    h9 = hma(close, 9)[:, -2:]
+    h21 = hma(close, 21)[:, -2:]
+    up = (h9[:, 0] < h21[:, 0]) & (h9[:, 1] > h21[:, 1])
+    down = (h9[:, 0] > h21[:, 0]) & (h9[:, 1] < h21[:, 1])
+    return up.astype(np.int64) - down.astype(np.int64)
+
+
+def heatmap_mean(tickers, ts):
+    """Историческая амплитуда из тепловой карты для дня недели и часа свечи ts каждого тикера."""
     try:
-        filepath = os.path.join(data_dir, f"{symbol}_3m.txt")
-        cols = ["ticker", "per", "date", "time", "open", "high", "low", "close", "vol"]
-        df = pd.read_csv(filepath, skiprows=1, names=cols)
-        df = df.dropna(subset=["close"])
-        df["close"] = pd.to_numeric(df["close"], errors="coerce")
-        df["open"] = pd.to_numeric(df["open"], errors="coerce")
-        df["high"] = pd.to_numeric(df["high"], errors="coerce")
-        df["low"] = pd.to_numeric(df["low"], errors="coerce")
-        df["vol"] = pd.to_numeric(df["vol"], errors="coerce")
-        return df
+        heatmaps = load_all()
     except Exception as e:
-        print(f"❌ Ошибка при загрузке {symbol}: {e}")
-        return pd.DataFrame()
-
-# === Контекст: heatmap и текущее время ===
-def get_context(heatmap_df: pd.DataFrame) -> dict:
-    now = datetime.now(pytz.timezone("Europe/Moscow"))
-    hour_str = now.strftime("%H:00")
-    weekday_str = now.strftime("%a")
-    weekday_map = {
-        "Mon": "Пн", "Tue": "Вт", "Wed": "Ср",
-        "Thu": "Чт", "Fri": "Пт", "Sat": "Сб", "Sun": "Вс"
-    }
-    weekday_name = weekday_map[weekday_str]
-    return {
-        'heatmap': heatmap_df,
-        'current_hour': hour_str,
-        'current_weekday': weekday_name
+        print(f"⚠️ Тепловая карта недоступна: {e}")
+        heatmaps = {}
+    wd, hr = weekday_hour(pd.DataFrame({"ts": np.nan_to_num(ts).astype(np.int64)}))
+    out = np.full(len(tickers), np.nan)
+    for i, ticker in enumerate(tickers):
+        heatmap = heatmaps.get(ticker)
+        if heatmap is not None and not np.isnan(ts[i]):
+            out[i] = heatmap[wd[i], hr[i]]
+    return out
+
+
+# === Скоринг ===
+def score_all(top_n=TOP_N):
+    """Скоринг всех тикеров за один проход; возвращает top_n строк по убыванию score."""
+    tickers, m3 = load_window("3m", FEATURE_COLUMNS, WINDOWS["3m"])
+    frames = {
+        "3m": m3,
+        "1h": align(load_window("1h", FEATURE_COLUMNS + ["amplitude"], WINDOWS["1h"]), tickers),
+        "1d": align(load_window("1d", FEATURE_COLUMNS, WINDOWS["1d"]), tickers),
     }
 
-# === Скоринг монеты ===
-def score_ticker(ticker_data, context):
-    score = 0
-    triggered_metrics = []
-
-    df_3m = ticker_data["3m"]
-    df_1h = ticker_data["1h"]
-    df_1d = ticker_data["1d"]
-
-    df_3m["hma_9"] = calculate_hma(df_3m["close"], 9)
-    df_3m["hma_21"] = calculate_hma(df_3m["close"], 21)
-    cross = (
-        df_3m["hma_9"].iloc[-2] < df_3m["hma_21"].iloc[-2]
-        and df_3m["hma_9"].iloc[-1] > df_3m["hma_21"].iloc[-1]
-    )
-
-    if cross:
-        score += 1
-        triggered_metrics.append("hma_cross")
-
-    # ATR фильтр
-    atr_21 = talib.ATR(df_3m["high"], df_3m["low"], df_3m["close"], timeperiod=21)
-    min_amp = get_min_amp(context)
-    amplitude = df_3m["high"].max() - df_3m["low"].min()
-    if amplitude >= min_amp:
-        score += 1
-        triggered_metrics.append("amp_ok")
-
-    # Volume фильтр
-    vol_3m = df_3m["vol"].iloc[-1]
-    vol_1h = df_1h["vol"].iloc[-1]
-    vol_1d = df_1d["vol"].iloc[-1]
-    if vol_3m > 50_000 and vol_1h > 500_000 and vol_1d > 2_000_000:
-        score += 1
-        triggered_metrics.append("vol_ok")
-
-    # 📊 Отладка:
-    symbol = df_3m["symbol"].iloc[-1] if "symbol" in df_3m.columns else "???"
-    print(f"\n📊 {symbol}:")
-    print(f"  HMA(9)[-1]={df_3m['hma_9'].iloc[-1]:.4f}, HMA(21)[-1]={df_3m['hma_21'].iloc[-1]:.4f}")
-    print(f"  Пересечение: {cross}")
-    print(f"  ATR: {atr_21.iloc[-1]:.4f}")
-    print(f"  Амплитуда: {amplitude:.2f} vs min_amp: {min_amp:.2f}")
-    print(f"  Объём 3m: {vol_3m:.2f}, 1h: {vol_1h:.2f}, 1d: {vol_1d:.2f}")
-
-    return {"score": score, "triggered": triggered_metrics}
+    close = m3["close"]
+    cross = hma_cross_last(close)
+
+    # ATR и всплеск объёма — одним вызовом на ТФ для всех тикеров
+    features = {}
+    for tf in FEATURE_TFS:
+        m = frames[tf]
+        atr_last = atr(m["high"], m["low"], m["close"], ATR_PERIOD, ATR_METHOD)[:, -1]
+        features[f"atr_pct_{tf}"] = atr_last / m["close"][:, -1] * 100
+    for tf in FEATURE_TFS:
+        features[f"vol_spike_{tf}"] = volume_spike(frames[tf]["vol"], VOLUME_SPIKE_WINDOW, VOLUME_SPIKE_RATIO)[:, -1]
+
+    amp_1h = frames["1h"]["amplitude"][:, -1]
+    amp_hist = heatmap_mean(tickers, frames["1h"]["ts"][:, -1])
+    vol_3m, vol_1h, vol_1d = (frames[tf]["vol"][:, -1] for tf in ["3m", "1h", "1d"])
+
+    metrics = {
+        # Балл, как в прежнем score_ticker, только за пересечение вверх
+        "hma_cross": cross > 0,
+        "amp_ok": amp_1h >= amp_hist,
+        "vol_ok": (vol_3m > MIN_VOL["3m"]) & (vol_1h > MIN_VOL["1h"]) & (vol_1d > MIN_VOL["1d"]),
+    }
+    score = np.sum(list(metrics.values()), axis=0)
+    names = np.array(list(metrics))
+    hits = np.column_stack(list(metrics.values()))
+
+    df = pd.DataFrame({
+        "ticker": tickers,
+        "score": score,
+        "triggered": [", ".join(names[row]) for row in hits],
+        "cross": np.select([cross > 0, cross < 0], ["long", "short"], ""),
+        "close": close[:, -1],
+        "amplitude_1h": amp_1h,
+        "amp_mean_hist": amp_hist,
+        "zscore_delta": amp_1h - amp_hist,
+        "vol_3m": vol_3m,
+        "vol_1h": vol_1h,
+        "vol_1d": vol_1d,
+        **features,
+    })
+    df = df.sort_values(["score", "zscore_delta", "atr_pct_3m"], ascending=False, na_position="last")
+    return df.head(top_n).reset_index(drop=True)
+
+
+# === Живой скоринг: ATR и всплески объёма по одной свече ===
+class LiveFeatures:
+    """atr_pct_{tf} и vol_spike_{tf} всех тикеров, как в score_all, но без пересчёта окон.
+
+    Закрытые бары проходят через BatchATR/BatchVolumeSpike.update по строке тикера.
+    Последний бар 1h/1d ещё открыт: он учитывается через peek() и фиксируется, когда
+    в хвосте появляется следующий бар. Если хвост переписывает уже учтённый бар или
+    строка ещё не прогрета, update() возвращает False — строку прогревают reset()
+    по последним WINDOWS[tf] барам.
+    """
+    __slots__ = ("rows", "atr", "spike", "ready", "done_ts", "open_bars", "values")
+
+    def __init__(self, tickers):
+        self.rows = {ticker: i for i, ticker in enumerate(tickers)}
+        n = len(self.rows)
+        self.atr = {tf: BatchATR(n, ATR_PERIOD, ATR_METHOD) for tf in FEATURE_TFS}
+        self.spike = {tf: BatchVolumeSpike(n, VOLUME_SPIKE_WINDOW, VOLUME_SPIKE_RATIO) for tf in FEATURE_TFS}
+        self.ready = {tf: np.zeros(n, dtype=bool) for tf in FEATURE_TFS}
+        # ts последнего зафиксированного (закрытого) бара строки
+        self.done_ts = {tf: np.full(n, -1, dtype=np.int64) for tf in FEATURE_TFS}
+        self.open_bars = {tf: {} for tf in FEATURE_TFS}
+        self.values = {}
+        for tf in FEATURE_TFS:
+            self.values[f"atr_pct_{tf}"] = np.full(n, np.nan)
+            self.values[f"vol_spike_{tf}"] = np.zeros(n, dtype=bool)
+
+    def _commit(self, row, tf, ts, high, low, close, vol):
+        self.atr[tf].update(high, low, close, row)
+        self.spike[tf].update(vol, row)
+        self.done_ts[tf][row] = ts
+
+    def _apply(self, row, tf, bars):
+        ts = epoch_ms(bars["date"].to_numpy(), bars["time"].to_numpy())
+        hlcv = bars[["high", "low", "close", "vol"]].to_numpy(dtype=np.float64)
+        held = self.open_bars[tf].pop(row, None)
+        if held is not None and held[0] < ts[0]:
+            self._commit(row, tf, *held)
+        closed = len(ts) if tf == "3m" else len(ts) - 1
+        for k in range(closed):
+            self._commit(row, tf, ts[k], *hlcv[k])
+        high, low, close, vol = hlcv[-1]
+        if closed < len(ts):
+            self.open_bars[tf][row] = (ts[-1], high, low, close, vol)
+            atr_last = self.atr[tf].peek(high, low, close, row)[0]
+            spike = self.spike[tf].peek(vol, row)[0]
+        else:
+            atr_last, spike = self.atr[tf].value[row], self.spike[tf].flag[row]
+        self.values[f"atr_pct_{tf}"][row] = atr_last / close * 100
+        self.values[f"vol_spike_{tf}"][row] = spike
+
+    def update(self, ticker, tf, bars):
+        """Учитывает хвост bars (date, time, high, low, close, vol) тикера; False — нужен reset()."""
+        row = self.rows[ticker]
+        first = epoch_ms(bars["date"].to_numpy()[:1], bars["time"].to_numpy()[:1])[0]
+        if not self.ready[tf][row] or first <= self.done_ts[tf][row]:
+            return False
+        self._apply(row, tf, bars)
+        return True
+
+    def reset(self, ticker, tf, bars):
+        """Прогрев строки тикера по последним барам ТФ (окно WINDOWS[tf], как у score_all)."""
+        row = self.rows[ticker]
+        self.atr[tf].reset(row)
+        self.spike[tf].reset(row)
+        self.open_bars[tf].pop(row, None)
+        self.done_ts[tf][row] = -1
+        self.ready[tf][row] = True
+        if len(bars):
+            self._apply(row, tf, bars)
+
+    def row(self, ticker):
+        return {name: values[self.rows[ticker]] for name, values in self.values.items()}
 
 
 # === Основной запуск ===
-# ... (весь импорт без изменений)
-
-# === Основной запуск с отладкой ===
 if __name__ == "__main__":
-    heatmap_path = "C:/Users/777/PycharmProjects/pythonProject/WarmMaps/SUMMARY_TICKERS.xlsx"
-    data_dir = "C:/Users/777/PycharmProjects/Booster4/data_live"
-
-    heatmap = pd.read_excel(heatmap_path, index_col=1).iloc[:, 2:-2]
-    print(f"🔍 Heatmap shape: {heatmap.shape}, columns: {list(heatmap.columns)}")
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--top", type=int, default=TOP_N, help="сколько тикеров показать")
+    args = parser.parse_args()
 
-    file_names = os.listdir(data_dir)
-    symbols = sorted(set(f.split("_")[0] for f in file_names if f.endswith("_3m.txt")))
-
-    print(f"\n🔍 Found {len(symbols)} tickers: {symbols[:5]}...")
+    start = time.perf_counter()
+    top = score_all(args.top)
+    elapsed = (time.perf_counter() - start) * 1000
 
     print("\n[TOP SIGNALS]")
-    for symbol in symbols:
-        ticker_data = load_ticker_data(data_dir, symbol)
-
-        # 🔍 Проверим наличие данных
-        for tf, df in ticker_data.items():
-            print(f"🔍 {symbol} {tf}: {len(df)} rows")
-
-        context = get_context(heatmap)
-        print(f"🔍 Time context: weekday={context['current_weekday']} hour={context['current_hour']}")
-
-        try:
-            result = score_ticker(ticker_data, context)
-            print(f"{symbol}: score = {result['score']}, metrics = {result['triggered']}")
-        except Exception as e:
-            print(f"❌ Ошибка в тикере {symbol}: {e}")
+    with pd.option_context("display.width", 200, "display.max_columns", None):
+        print(top.to_string(index=False, float_format=lambda x: f"{x:.4g}"))
+    print(f"\n🕒 Скоринг выполнен за {elapsed:.1f} мс")
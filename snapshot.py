@@ -0,0 +1,178 @@
+import os
+import json
+import time
+import shutil
+import sqlite3
+import numpy as np
+import pandas as pd
+
+from candle_store import BASE, STORE_PATH, VALUE_COLUMNS
+
+# === Бинарный снимок хранилища ===
+# Раскладка: SNAPSHOT_DIR/<поколение>/<tf>_<колонка>.npy — колонка по всем тикерам подряд,
+# <tf>_index.json — {тикер: [начало, конец]}; файл CURRENT указывает на актуальное поколение.
+# Поколения не перезаписываются на месте, поэтому открытые memmap-ы читателей остаются валидными.
+SNAPSHOT_DIR = os.path.join(BASE, "snapshot")
+INT_COLUMNS = {"ts", "hma_cross"}
+KEEP_GENERATIONS = 2
+
+_mmaps = {}
+
+
+# === Запись ===
+def write_snapshot(path=STORE_PATH, out=SNAPSHOT_DIR):
+    gen = f"gen-{int(time.time() * 1000)}"
+    gen_dir = os.path.join(out, gen)
+    os.makedirs(gen_dir, exist_ok=True)
+
+    with sqlite3.connect(path) as conn:
+        # Одна читающая транзакция: версии рядов соответствуют выгруженным строкам
+        conn.execute("BEGIN")
+        tfs = [r[0] for r in conn.execute("SELECT DISTINCT tf FROM candles")]
+        try:
+            versions = conn.execute("SELECT ticker, tf, version FROM series_versions").fetchall()
+        except sqlite3.OperationalError:
+            versions = []
+        for tf in tfs:
+            df = pd.read_sql_query(
+                f"SELECT ticker, ts, {', '.join(VALUE_COLUMNS)} FROM candles WHERE tf = ? ORDER BY ticker, ts",
+                conn, params=(tf,),
+            )
+            tickers = df["ticker"].to_numpy()
+            bounds = np.flatnonzero(tickers[1:] != tickers[:-1]) + 1
+            starts = np.concatenate([[0], bounds]).tolist() if len(df) else []
+            stops = np.concatenate([bounds, [len(df)]]).tolist() if len(df) else []
+            index = {tickers[a]: [a, b] for a, b in zip(starts, stops)}
+
+            for col in ["ts"] + VALUE_COLUMNS:
+                values = df[col]
+                if values.isna().all():
+                    continue
+                if col in INT_COLUMNS:
+                    arr = values.fillna(0).to_numpy(dtype=np.int64)
+                else:
+                    arr = values.to_numpy(dtype=np.float64)
+                np.save(os.path.join(gen_dir, f"{tf}_{col}.npy"), arr)
+            with open(os.path.join(gen_dir, f"{tf}_index.json"), "w", encoding="utf-8") as f:
+                json.dump(index, f)
+            with open(os.path.join(gen_dir, f"{tf}_versions.json"), "w", encoding="utf-8") as f:
+                json.dump({t: v for t, t_tf, v in versions if t_tf == tf}, f)
+
+    tmp = os.path.join(out, "CURRENT.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(gen)
+    os.replace(tmp, os.path.join(out, "CURRENT"))
+
+    gens = sorted(d for d in os.listdir(out) if d.startswith("gen-"))
+    for old in gens[:-KEEP_GENERATIONS]:
+        shutil.rmtree(os.path.join(out, old), ignore_errors=True)
+    return gen_dir
+
+
+# === Чтение ===
+def current_generation(out=SNAPSHOT_DIR):
+    try:
+        with open(os.path.join(out, "CURRENT"), encoding="utf-8") as f:
+            return os.path.join(out, f.read().strip())
+    except FileNotFoundError:
+        return None
+
+
+def _open(gen_dir, name):
+    key = (gen_dir, name)
+    if key not in _mmaps:
+        # Новое поколение — старые memmap-ы больше не нужны
+        for stale in [k for k in _mmaps if k[0] != gen_dir]:
+            del _mmaps[stale]
+        if name.endswith(".json"):
+            with open(os.path.join(gen_dir, name), encoding="utf-8") as f:
+                _mmaps[key] = json.load(f)
+        else:
+            _mmaps[key] = np.load(os.path.join(gen_dir, name), mmap_mode="r")
+    return _mmaps[key]
+
+
+def load_arrays(ticker, tf, columns=None, out=SNAPSHOT_DIR):
+    """Колонки ряда (ticker, tf) как срезы memmap — без копирования.
+
+    Возвращает None, если снимка нет или в нём нет такого ряда.
+    """
+    gen_dir = current_generation(out)
+    if gen_dir is None or not os.path.exists(os.path.join(gen_dir, f"{tf}_index.json")):
+        return None
+    bounds = _open(gen_dir, f"{tf}_index.json").get(ticker)
+    if bounds is None:
+        return None
+    a, b = bounds
+    if columns is None:
+        columns = ["ts"] + VALUE_COLUMNS
+    arrays = {}
+    for col in columns:
+        if os.path.exists(os.path.join(gen_dir, f"{tf}_{col}.npy")):
+            arrays[col] = _open(gen_dir, f"{tf}_{col}.npy")[a:b]
+    return arrays
+
+
+def load_frame(ticker, tf, columns=None, out=SNAPSHOT_DIR):
+    """То же, что load_arrays, но в виде DataFrame с колонкой datetime (московское время)."""
+    arrays = load_arrays(ticker, tf, columns, out)
+    if arrays is None:
+        return None
+    df = pd.DataFrame(arrays, copy=False)
+    if "ts" in df.columns:
+        df["datetime"] = pd.to_datetime(df["ts"], unit="ms", utc=True).dt.tz_convert("Europe/Moscow").dt.tz_localize(None)
+    return df
+
+
+def load_matrix(tf, columns, window, out=SNAPSHOT_DIR):
+    """Последние window строк каждого тикера как 2-D массивы (тикер × время).
+
+    Ряды выровнены по правому краю, недостающие слева — NaN; значения копируются
+    из memmap одним fancy-indexing на колонку. Возвращает (тикеры, {колонка: массив})
+    или None, если снимка нет.
+    """
+    gen_dir = current_generation(out)
+    if gen_dir is None or not os.path.exists(os.path.join(gen_dir, f"{tf}_index.json")):
+        return None
+    index = _open(gen_dir, f"{tf}_index.json")
+    tickers = sorted(index)
+    bounds = np.array([index[t] for t in tickers], dtype=np.int64).reshape(-1, 2)
+    pos = bounds[:, 1:] - window + np.arange(window)
+    valid = pos >= bounds[:, :1]
+    pos = np.where(valid, pos, 0)
+    matrix = {}
+    for col in ["ts"] + [c for c in columns if c != "ts"]:
+        if not os.path.exists(os.path.join(gen_dir, f"{tf}_{col}.npy")):
+            continue
+        arr = np.asarray(_open(gen_dir, f"{tf}_{col}.npy")[pos], dtype=np.float64)
+        arr[~valid] = np.nan
+        matrix[col] = arr
+    return tickers, matrix
+
+
+def series_version(ticker, tf, out=SNAPSHOT_DIR):
+    """Версия ряда (из series_versions хранилища), попавшая в текущий снимок, или None."""
+    gen_dir = current_generation(out)
+    if gen_dir is None or not os.path.exists(os.path.join(gen_dir, f"{tf}_versions.json")):
+        return None
+    return _open(gen_dir, f"{tf}_versions.json").get(ticker)
+
+
+def is_current(tf, versions, out=SNAPSHOT_DIR):
+    """Снимок ТФ tf не отстал от хранилища: версии всех рядов из versions ({(ticker, tf): версия}) совпадают."""
+    gen_dir = current_generation(out)
+    if gen_dir is None or not os.path.exists(os.path.join(gen_dir, f"{tf}_versions.json")):
+        return not any(v_tf == tf for _, v_tf in versions)
+    held = _open(gen_dir, f"{tf}_versions.json")
+    return all(held.get(ticker) == v for (ticker, v_tf), v in versions.items() if v_tf == tf)
+
+
+def list_tickers(tf, out=SNAPSHOT_DIR):
+    gen_dir = current_generation(out)
+    if gen_dir is None or not os.path.exists(os.path.join(gen_dir, f"{tf}_index.json")):
+        return []
+    return sorted(_open(gen_dir, f"{tf}_index.json"))
+
+
+if __name__ == "__main__":
+    print(f"✅ Снимок записан: {write_snapshot()}")
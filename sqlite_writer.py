@@ -0,0 +1,72 @@
+import sqlite3
+import numpy as np
+import pandas as pd
+
+from candle_store import column_type
+
+# === Быстрая запись таблицы в SQLite ===
+# WAL + synchronous=NORMAL: коммит не ждёт fsync основного файла, читатели не блокируют писателя
+PRAGMAS = ["PRAGMA journal_mode=WAL", "PRAGMA synchronous=NORMAL"]
+
+
+def connect(path):
+    conn = sqlite3.connect(path, isolation_level=None)
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+def _column_buffer(values: pd.Series, col: str):
+    """Колонка как итерируемый буфер для executemany без промежуточного списка.
+
+    Числа идут через memoryview NumPy-массива (Python-скаляры создаются по одному
+    при чтении), NaN в REAL-колонке SQLite сам сохраняет как NULL. Строки и
+    колонки с пропусками в INTEGER остаются object-массивами.
+    """
+    kind = column_type(col)
+    if kind == "TEXT":
+        arr = values.to_numpy(dtype=object)
+        missing = values.isna().to_numpy()
+        if missing.any():
+            arr = arr.copy()
+            arr[missing] = None
+        return arr
+    numeric = values if pd.api.types.is_numeric_dtype(values) else pd.to_numeric(values, errors="coerce")
+    if kind == "INTEGER":
+        if numeric.isna().any():
+            arr = numeric.to_numpy(dtype=np.float64)
+            out = np.where(np.isnan(arr), 0, arr).astype(np.int64).astype(object)
+            out[np.isnan(arr)] = None
+            return out
+        return memoryview(numeric.to_numpy(dtype=np.int64))
+    return memoryview(np.ascontiguousarray(numeric.to_numpy(dtype=np.float64)))
+
+
+def write_table(path, df: pd.DataFrame, table="candles"):
+    """Полностью заменяет таблицу содержимым df одной транзакцией.
+
+    Данные пишутся во временную таблицу с типами из column_type, затем старая
+    удаляется, а новая переименовывается — всё до COMMIT, поэтому читатель видит
+    либо прежнюю таблицу, либо новую целиком.
+    """
+    columns = list(df.columns)
+    tmp = f"{table}__new"
+    conn = connect(path) if isinstance(path, str) else path
+    try:
+        conn.execute("BEGIN")
+        try:
+            conn.execute(f'DROP TABLE IF EXISTS "{tmp}"')
+            conn.execute(f'CREATE TABLE "{tmp}" ({", ".join(f"{col} {column_type(col)}" for col in columns)})')
+            conn.executemany(
+                f'INSERT INTO "{tmp}" VALUES ({", ".join("?" * len(columns))})',
+                zip(*(_column_buffer(df[col], col) for col in columns)),
+            )
+            conn.execute(f'DROP TABLE IF EXISTS "{table}"')
+            conn.execute(f'ALTER TABLE "{tmp}" RENAME TO "{table}"')
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+    finally:
+        if conn is not path:
+            conn.close()
@@ -1,97 +1,94 @@
 import streamlit as st
-import pandas as pd
-import sqlite3
-import os
 import plotly.graph_objects as go
 import plotly.express as px
 
+from candle_store import list_tickers
+from snapshot import list_tickers as snapshot_tickers
+from decimate import MAX_POINTS, ohlc_buckets, lttb_frame, ohlc_hover
+from dashboard_cache import load_series, load_cross_counts, series_version, watch_updates
+
 # Настройки страницы
 st.set_page_config(page_title="TradingView-style Dashboard", layout="wide")
 st.header("🕯️ TradingView-style дашборд с HMA и сигналами")
 
-# Пути к данным и мэппинг таймфреймов
-BASE_PATH = "C:/Users/777/PycharmProjects/Booster4/scoring_p/datasets"
-TF_MAP = {"3m": "3mtf", "1h": "1htf", "1d": "1dtf"}
+# Таймфреймы
+TF_LIST = ["3m", "1h", "1d"]
 
 # Sidebar: выбор таймфрейма и тикера
-tf = st.sidebar.selectbox("Выбери таймфрейм", list(TF_MAP.keys()), index=1)
-data_dir = os.path.join(BASE_PATH, TF_MAP[tf])
-tickers = sorted({f.split('_')[0] for f in os.listdir(data_dir) if f.endswith(".sqlite")})
+tf = st.sidebar.selectbox("Выбери таймфрейм", TF_LIST, index=1)
+tickers = snapshot_tickers(tf) or list_tickers(tf)
 ticker = st.sidebar.selectbox("Выбери тикер", tickers)
 
-# Функции для загрузки данных
-@st.cache_data
-def load_data(ticker, tf):
-    path = os.path.join(BASE_PATH, TF_MAP[tf], f"{ticker}_{tf}.sqlite")
-    conn = sqlite3.connect(path)
-    df = pd.read_sql("SELECT * FROM candles", conn)
-    conn.close()
-    df["datetime"] = pd.to_datetime(df["date"] + " " + df["time"], errors="coerce")
-    for col in df.columns.difference(["ticker","per","date","time","datetime"]):
-        df[col] = pd.to_numeric(df[col], errors="coerce")
-    return df.sort_values("datetime")
-
-@st.cache_data
-def load_data_3m(ticker):
-    path = os.path.join(BASE_PATH, TF_MAP["3m"], f"{ticker}_3m.sqlite")
-    conn = sqlite3.connect(path)
-    df3 = pd.read_sql("SELECT * FROM candles", conn)
-    conn.close()
-    df3["datetime"] = pd.to_datetime(df3["date"] + " " + df3["time"], errors="coerce")
-    for col in df3.columns.difference(["ticker","per","date","time","datetime"]):
-        df3[col] = pd.to_numeric(df3[col], errors="coerce")
-    return df3.sort_values("datetime")
-
-# Загрузка данных
-df = load_data(ticker, tf)
-df3m = load_data_3m(ticker)
+# Загрузка данных: общий кэш процесса; после публикации новой версии ряда дочитывается только хвост
+version = series_version(ticker, tf)
+df = load_series(ticker, tf)
+watch_updates(lambda: series_version(ticker, tf), version)
 
 # Фильтр по дате
 st.sidebar.markdown("### ⏳ Фильтр по дате")
 start = st.sidebar.date_input("С", df["datetime"].dt.date.min())
 end   = st.sidebar.date_input("По", df["datetime"].dt.date.max())
 df = df[(df["datetime"].dt.date >= start) & (df["datetime"].dt.date <= end)]
-df3m = df3m[(df3m["datetime"].dt.date >= start) & (df3m["datetime"].dt.date <= end)]
 
-# Фильтр сигналов HMA_cross для 1h
+# Фильтр сигналов HMA_cross
 if "hma_cross" in df.columns:
-    selected_signals = st.sidebar.multiselect("Фильтр сигналов HMA_cross", [-1, 0, 1], default=[-1, 1])
-    df_signals = df[df["hma_cross"].isin(selected_signals)]
+    selected_signals = st.sidebar.multiselect("Фильтр сигналов HMA_cross", [-1, 1], default=[-1, 1])
 else:
-    df_signals = pd.DataFrame()
+    selected_signals = []
+show_density = "density_hma_cross" in df.columns and st.sidebar.checkbox("Плотность HMA_cross на графике цены", value=False)
+
+# Видимый диапазон: браузеру уходит не больше MAX_POINTS свечей, при сужении диапазона
+# свечи пересобираются из исходных строк и детализация растёт вплоть до полной
+if len(df) > 1:
+    t0, t1 = df["datetime"].min().to_pydatetime(), df["datetime"].max().to_pydatetime()
+    view = st.sidebar.slider("🔍 Видимый диапазон", min_value=t0, max_value=t1, value=(t0, t1), format="DD.MM.YY HH:mm")
+    df_view = df[(df["datetime"] >= view[0]) & (df["datetime"] <= view[1])]
+else:
+    df_view = df
+candles = ohlc_buckets(df_view, MAX_POINTS)
 
 # 1️⃣ TradingView-style дашборд (цена + HMA + сигналы)
 st.subheader("📈 Цена и HMA")
+if len(candles) < len(df_view):
+    st.caption(f"{len(df_view)} свечей сжато до {len(candles)}; сузьте видимый диапазон для полной детализации")
 fig = go.Figure()
-# Подготовка hovertext с амплитудой и данными OHLC
-hover_texts = df.apply(
-    lambda r: f"Time: {r['datetime']}<br>O: {r['open']}<br>H: {r['high']}<br>L: {r['low']}<br>C: {r['close']}<br>Amp: {r.get('amplitude', '')}",
-    axis=1
-)
 fig.add_trace(go.Candlestick(
-    x=df["datetime"], open=df["open"], high=df["high"],
-    low=df["low"], close=df["close"], name="OHLC",
-    hovertext=hover_texts,
+    x=candles["datetime"], open=candles["open"], high=candles["high"],
+    low=candles["low"], close=candles["close"], name="OHLC",
+    hovertext=ohlc_hover(candles),
     hoverinfo="text"
 ))
 # HMA линии
 for hma in ["hma9", "hma21"]:
-    if hma in df.columns:
+    if hma in df_view.columns:
+        line = lttb_frame(df_view, hma, MAX_POINTS)
         fig.add_trace(go.Scatter(
-            x=df["datetime"], y=df[hma], mode="lines", name=hma.upper(), hoverinfo="none"
+            x=line["datetime"], y=line[hma], mode="lines", name=hma.upper(), hoverinfo="none"
         ))
-# Вертикальные линии сигналов на 1h
-if tf == "1h" and not df_signals.empty:
-    for _, row in df_signals[df_signals["hma_cross"] != 0].iterrows():
-        color = "green" if row["hma_cross"] == 1 else "red"
-        fig.add_shape(
-            type="line", x0=row["datetime"], x1=row["datetime"],
-            y0=0, y1=1, yref="paper", xref="x",
-            line=dict(color=color, width=2)
-        )
-# Навигация и горизонт/вертикальный зум
+# Сигналы: по одному scatter-трейсу на направление вместо add_shape на каждый кросс
+for side, low_side, symbol, color in [(1, True, "triangle-up", "green"), (-1, False, "triangle-down", "red")]:
+    if side not in selected_signals:
+        continue
+    hits = df_view[df_view["hma_cross"].to_numpy() == side]
+    if hits.empty:
+        continue
+    fig.add_trace(go.Scatter(
+        x=hits["datetime"], y=hits["low"] * 0.998 if low_side else hits["high"] * 1.002,
+        mode="markers", name="HMA cross ↑" if side == 1 else "HMA cross ↓",
+        marker=dict(symbol=symbol, size=10, color=color),
+        hovertext="HMA cross " + hits["datetime"].astype(str), hoverinfo="text"
+    ))
+# Плотность кроссов — столбцы на второй оси под свечами
+if show_density:
+    density = df_view.dropna(subset=["density_hma_cross"])
+    fig.add_trace(go.Bar(
+        x=density["datetime"], y=density["density_hma_cross"], name="Плотность HMA_cross",
+        marker=dict(color="rgba(100, 100, 255, 0.3)"), yaxis="y2", hoverinfo="x+y"
+    ))
+    fig.update_layout(yaxis2=dict(overlaying="y", side="right", showgrid=False, rangemode="tozero"))
+# Навигация и горизонт/вертикальный зум; range slider не нужен — он дублирует весь ряд в браузере
 fig.update_layout(
-    xaxis=dict(rangeslider=dict(visible=True), type="date"),
+    xaxis=dict(rangeslider=dict(visible=False), type="date"),
     yaxis=dict(type="log"),        # <-- вот это делает ось Y логарифмической
     dragmode="zoom",
     height=1200
@@ -114,10 +111,10 @@ st.dataframe(df.tail(6))
 if "amplitude" in df.columns:
     st.subheader("🔥 Amplitude")
     fig_am = px.line(
-        df, x="datetime", y="amplitude", markers=True, title="Amplitude over time"
+        lttb_frame(df_view, "amplitude", MAX_POINTS), x="datetime", y="amplitude", markers=True, title="Amplitude over time"
     )
     fig_am.update_layout(
-        xaxis=dict(rangeslider=dict(visible=True), type="date"),
+        xaxis=dict(type="date"),
         height=1000
     )
     st.plotly_chart(
@@ -130,16 +127,18 @@ if "amplitude" in df.columns:
 if "amp_eff_last3" in df.columns and "amp_eff_last6" in df.columns:
     st.subheader("📊 Amp_eff_last3 (красный) и Amp_eff_last6 (синий)")
     fig_eff = go.Figure()
+    eff3 = lttb_frame(df_view, "amp_eff_last3", MAX_POINTS)
+    eff6 = lttb_frame(df_view, "amp_eff_last6", MAX_POINTS)
     fig_eff.add_trace(go.Scatter(
-        x=df["datetime"], y=df["amp_eff_last3"], mode="lines+markers",
+        x=eff3["datetime"], y=eff3["amp_eff_last3"], mode="lines+markers",
         name="amp_eff_last3", line=dict(color="red"), marker=dict(color="red")
     ))
     fig_eff.add_trace(go.Scatter(
-        x=df["datetime"], y=df["amp_eff_last6"], mode="lines+markers",
+        x=eff6["datetime"], y=eff6["amp_eff_last6"], mode="lines+markers",
         name="amp_eff_last6", line=dict(color="#40E0D0"), marker=dict(color="#40E0D0")
     ))
     fig_eff.update_layout(
-        xaxis=dict(rangeslider=dict(visible=True), type="date"),
+        xaxis=dict(type="date"),
         height=1000
     )
     st.plotly_chart(
@@ -150,15 +149,10 @@ if "amp_eff_last3" in df.columns and "amp_eff_last6" in df.columns:
 
 # 5️⃣ ⌚ Hourly HMA_cross count (3m)
 st.subheader("⌚ Плотность HMA_cross по часам (3m)")
-hourly = (
-    df3m.assign(hour=df3m["datetime"].dt.floor("H"))
-    .groupby("hour")["hma_cross"]
-    .apply(lambda x: (x != 0).sum())
-    .reset_index(name="count")
-)
+hourly = load_cross_counts(ticker, "1h", start, end)
 fig_hr = px.bar(
-    hourly, x="hour", y="count", text="count",
-    labels={"hour":"Hour","count":"Count"},
+    hourly, x="datetime", y="count", text="count",
+    labels={"datetime":"Hour","count":"Count"},
     title="Hourly HMA_cross count (3m)"
 )
 fig_hr.update_layout(
@@ -173,15 +167,10 @@ st.plotly_chart(
 
 # 6️⃣ 📅 Daily HMA_cross count (3m)
 st.subheader("📅 Ежедневное количество HMA_cross (3m)")
-daily = (
-    df3m.assign(date=df3m["datetime"].dt.date)
-    .groupby("date")["hma_cross"]
-    .apply(lambda x: (x != 0).sum())
-    .reset_index(name="count")
-)
+daily = load_cross_counts(ticker, "1d", start, end)
 fig_daily = px.bar(
-    daily, x="date", y="count", text="count",
-    labels={"date":"Date","count":"Count"},
+    daily, x="datetime", y="count", text="count",
+    labels={"datetime":"Date","count":"Count"},
     title="Daily HMA_cross count (3m)"
 )
 fig_daily.update_layout(
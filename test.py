@@ -1,62 +1,30 @@
 import os
 import sqlite3
 import pandas as pd
-from datetime import datetime
 import numpy as np
 import asyncio
 import aiosqlite
 import sys
 
-# === Константы ===
-WEEKDAY_MAP = {
-    0: "Пн", 1: "Вт", 2: "Ср", 3: "Чт", 4: "Пт", 5: "Сб", 6: "Вс"
-}
+from candle_store import column_type
+from heatmap import HEATMAP_PATH, load_heatmap as load_heatmap_array, lookup
 
-HEATMAP_PATH = r"C:\Users\777\PycharmProjects\Booster4\WarmMaps\RESULT_HEAT_MAP.xlsx"
+# === Константы ===
 DB_FOLDER = r"C:\Users\777\PycharmProjects\Booster4\scoring_p\datasets\1htf"
 STD_ESTIMATE = 0.15
 CONCURRENCY = 6
 
 # === Загрузка тепловой карты ===
-def load_heatmap(ticker: str) -> dict:
-    sheet_name = f"{ticker}_H1"
-    try:
-        df = pd.read_excel(HEATMAP_PATH, sheet_name=sheet_name)
-    except Exception as e:
-        print(f"❌ {ticker}: не удалось загрузить тепловую карту {sheet_name}: {e}")
-        return {}
-
-    df = df.loc[:, ~df.columns.str.contains("Среднее|Медиана")]
-    heatmap = {}
-    for _, row in df.iterrows():
-        weekday = row["weekday_name"]
-        for hour in df.columns[1:]:
-            heatmap[(weekday, hour)] = row[hour]
+def load_heatmap(ticker: str) -> np.ndarray:
+    heatmap = load_heatmap_array(ticker)
+    if heatmap is None:
+        print(f"❌ {ticker}: не удалось загрузить тепловую карту {ticker}_H1 из {HEATMAP_PATH}")
     return heatmap
 
-# === Получить (день недели, час) по дате и времени ===
-def get_weekday_hour_key(date_str: str, time_str: str) -> tuple:
-    try:
-        dt = datetime.strptime(date_str + time_str, "%Y%m%d%H%M%S")
-        return WEEKDAY_MAP[dt.weekday()], dt.strftime("%H:00")
-    except:
-        return None, None
-
-# === Добавить исторические значения и дельту ===
-def add_stats(df: pd.DataFrame, heatmap: dict) -> pd.DataFrame:
+# === Добавить исторические значения и дельту (массив 7×24, без цикла по строкам) ===
+def add_stats(df: pd.DataFrame, heatmap: np.ndarray) -> pd.DataFrame:
     df["amplitude"] = pd.to_numeric(df["amplitude"], errors="coerce")
-    means, deltas = [], []
-    for date, time, amp in zip(df["date"], df["time"], df["amplitude"]):
-        key = get_weekday_hour_key(str(date), str(time))
-        if key is None:
-            mean, delta = np.nan, np.nan
-        else:
-            mean = heatmap.get(key, np.nan)
-            delta = amp - mean if pd.notna(mean) and pd.notna(amp) else np.nan
-        means.append(mean)
-        deltas.append(delta)
-    df["amp_mean_hist"] = means
-    df["zscore_delta"] = deltas
+    df["amp_mean_hist"], df["zscore_delta"] = lookup(df, heatmap)
     return df
 
 # === Асинхронная обработка одного файла ===
@@ -66,7 +34,7 @@ async def process_file(file: str, sem: asyncio.Semaphore, index: int, total: int
         ticker = file.replace("_1h.sqlite", "")
         try:
             heatmap = load_heatmap(ticker)
-            if not heatmap:
+            if heatmap is None:
                 return
 
             async with aiosqlite.connect(db_path) as conn:
@@ -79,7 +47,7 @@ async def process_file(file: str, sem: asyncio.Semaphore, index: int, total: int
 
             async with aiosqlite.connect(db_path) as conn:
                 await conn.execute("DROP TABLE IF EXISTS candles")
-                cols = ",".join(f"{col} TEXT" for col in df.columns)
+                cols = ",".join(f"{col} {column_type(col)}" for col in df.columns)
                 await conn.execute(f"CREATE TABLE candles ({cols})")
                 await conn.executemany(
                     f"INSERT INTO candles VALUES ({','.join(['?']*len(df.columns))})",
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# Модули репозитория — плоские скрипты в корне
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
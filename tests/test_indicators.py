@@ -0,0 +1,100 @@
+import os
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from indicators import (
+    BatchATR, BatchVolumeSpike, StreamingHMA, StreamingHMACross, add_indicators, atr, hma, volume_spike,
+)
+
+SAMPLE_3M = os.path.join(os.path.dirname(__file__), "..", "scoring_p", "datasets", "3mtf", "BTCUSDTSWAP_3m.sqlite")
+
+
+# Прежняя реализация из FunBoost4.py — эталон для регрессии
+def wma_rolling(series, period):
+    weights = list(range(1, period + 1))
+    return series.rolling(period).apply(lambda x: sum(w * val for w, val in zip(weights, x)) / sum(weights), raw=True)
+
+
+def hma_rolling(series, period):
+    half = int(period / 2)
+    sqrt_n = int(period ** 0.5)
+    return wma_rolling(2 * wma_rolling(series, half) - wma_rolling(series, period), sqrt_n)
+
+
+@pytest.fixture(scope="module")
+def close():
+    if not os.path.exists(SAMPLE_3M):
+        pytest.skip("нет сохранённой 3m-базы")
+    with sqlite3.connect(SAMPLE_3M) as conn:
+        df = pd.read_sql_query("SELECT close FROM candles", conn)
+    return pd.to_numeric(df["close"], errors="coerce")
+
+
+@pytest.mark.parametrize("period", [9, 21])
+def test_hma_matches_rolling_apply(close, period):
+    assert hma(close, period).equals(hma_rolling(close, period))
+
+
+# === Потоковые индикаторы против векторных ===
+@pytest.mark.parametrize("period", [9, 21])
+def test_streaming_hma_matches_hma(close, period):
+    state = StreamingHMA(period)
+    streamed = np.array([state.update(value) for value in close.tolist()])
+    np.testing.assert_array_equal(streamed, hma(close, period).to_numpy())
+
+
+def test_streaming_cross_matches_add_indicators_and_rebuilds_from_tail(close):
+    expected = add_indicators(pd.DataFrame({"close": close, "high": close, "low": close}))["hma_cross"].to_numpy()
+    state = StreamingHMACross()
+    assert [state.update(value) for value in close.tolist()] == expected.tolist()
+
+    # Восстановление по хвосту даёт то же состояние, что и проход по всей истории
+    values = close.to_numpy()
+    for end in range(100, len(values), 97):
+        rebuilt = StreamingHMACross.from_closes(values[:end])
+        assert rebuilt.cross == expected[end - 1]
+        assert rebuilt.update(values[end]) == expected[end]
+
+
+# === ATR и всплески объёма: пошагово по строкам против расчёта по окну ===
+def random_bars(n=5, t=60, seed=1):
+    rng = np.random.default_rng(seed)
+    close = 100 + rng.standard_normal((n, t)).cumsum(axis=1)
+    high = close + rng.random((n, t))
+    low = close - rng.random((n, t))
+    vol = rng.random((n, t)) * 1e3
+    return high, low, close, vol
+
+
+@pytest.mark.parametrize("method", ["simple", "wilder"])
+def test_batch_atr_row_updates_and_peek_match_atr(method):
+    high, low, close, vol = random_bars()
+    expected = atr(high, low, close, 14, method)
+    state = BatchATR(len(high), 14, method)
+    # Тикеры закрывают бары независимо: строки обновляются по одной, в разном порядке
+    for t in range(high.shape[1] - 1):
+        for row in np.random.default_rng(t).permutation(len(high)):
+            state.update(high[row, t], low[row, t], close[row, t], row)
+        np.testing.assert_allclose(state.value, expected[:, t], rtol=1e-12)
+    before = state.value.copy()
+    np.testing.assert_allclose(state.peek(high[:, -1], low[:, -1], close[:, -1]), expected[:, -1], rtol=1e-12)
+    np.testing.assert_array_equal(state.value, before)
+
+    state.reset(0)
+    assert np.isnan(state.value[0]) and not np.isnan(state.value[1:]).any()
+
+
+def test_batch_volume_spike_row_updates_and_peek_match_volume_spike():
+    vol = random_bars()[3]
+    vol[:, ::7] *= 3
+    expected = volume_spike(vol, 20, 1.5)
+    state = BatchVolumeSpike(len(vol), 20, 1.5)
+    for t in range(vol.shape[1] - 1):
+        for row in range(len(vol)):
+            state.update(vol[row, t], row)
+        np.testing.assert_array_equal(state.flag, expected[:, t])
+    np.testing.assert_array_equal(state.peek(vol[:, -1]), expected[:, -1])
+    assert expected.any()
@@ -0,0 +1,224 @@
+import os
+import json
+import asyncio
+import sqlite3
+import contextlib
+import functools
+
+import numpy as np
+import pandas as pd
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+import okx_client
+import Booster_live
+import run_scoring
+import candle_store
+from candle_store import epoch_ms, read_candles, read_cross_counts
+from okx_client import BAR_MS, HISTORY_CANDLES
+
+TICKER = "SUIUSDTSWAP"
+INST_ID = "SUI-USDT-SWAP"
+BAR = BAR_MS["3m"]
+T0 = 1_749_700_800_000  # 07:00 МСК, начало часа
+# 500 баров — больше ATR_PERIOD часов, чтобы живые ATR/всплески 1h были не пустыми
+N_STORED = 500
+GAP_TO = 505
+
+
+def make_truth(n=540, seed=7):
+    rng = np.random.default_rng(seed)
+    ts = T0 + np.arange(n, dtype=np.int64) * BAR
+    close = 3.3 + rng.standard_normal(n).cumsum() * 0.01
+    open_ = np.r_[close[0], close[:-1]]
+    high = np.maximum(open_, close) + rng.random(n) * 0.01
+    low = np.minimum(open_, close) - rng.random(n) * 0.01
+    vol = rng.random(n) * 1e5
+    return ts, np.column_stack([open_, high, low, close, vol])
+
+
+def okx_row(ts, ohlcv, confirm="1"):
+    o, h, l, c, v = (repr(float(x)) for x in ohlcv)
+    return [str(int(ts)), o, h, l, c, "0", "0", v, confirm]
+
+
+def ws_message(ts, ohlcv, confirm="1"):
+    return json.dumps({"arg": {"channel": "candle3m", "instId": INST_ID}, "data": [okx_row(ts, ohlcv, confirm)]})
+
+
+def folders(root):
+    return {tf: os.path.join(root, f"{tf}tf") for tf in ["3m", "1h", "1d"]}
+
+
+def read_tf(root, tf):
+    with sqlite3.connect(os.path.join(folders(root)[tf], f"{TICKER}_{tf}.sqlite")) as conn:
+        df = pd.read_sql_query("SELECT * FROM candles ORDER BY date, time", conn)
+    df.insert(0, "ts", epoch_ms(df["date"].to_numpy(), df["time"].to_numpy()))
+    return df
+
+
+@contextlib.asynccontextmanager
+async def okx_stand_in(ts, ohlcv, sessions):
+    """REST history-candles по «бирже» ts/ohlcv и WebSocket, отдающий по соединению сценарий sessions[i]."""
+    log = {"rest": [], "ws": 0}
+
+    async def history(request):
+        log["rest"].append(dict(request.query))
+        after, before = int(request.query["after"]), int(request.query["before"])
+        limit = int(request.query.get("limit", 100))
+        idx = np.flatnonzero((ts > before) & (ts < after))[::-1][:limit]
+        return web.json_response({"code": "0", "data": [okx_row(ts[i], ohlcv[i]) for i in idx]})
+
+    async def stream(request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        script = sessions[min(log["ws"], len(sessions) - 1)]
+        log["ws"] += 1
+        subscribe = json.loads((await ws.receive()).data)
+        assert subscribe["args"][0]["instId"] == INST_ID
+        for message in script["send"]:
+            await ws.send_str(message)
+        if script["close"]:
+            await ws.close()  # обрыв со стороны сервера
+        else:
+            async for _ in ws:
+                pass
+        return ws
+
+    app = web.Application()
+    app.router.add_get(HISTORY_CANDLES, history)
+    app.router.add_get("/ws", stream)
+    server = TestServer(app)
+    await server.start_server()
+    try:
+        yield f"http://{server.host}:{server.port}", f"ws://{server.host}:{server.port}/ws", log
+    finally:
+        await server.close()
+
+
+@pytest.fixture
+def live_env(tmp_path, monkeypatch):
+    monkeypatch.setattr(okx_client, "backoff_delay", lambda attempt, base=0.5, cap=10.0: 0.0)
+    monkeypatch.setattr(Booster_live, "PUBLISH_DELAY", 0.05)
+    heatmap = np.linspace(0.5, 2.0, 7 * 24).reshape(7, 24)
+    monkeypatch.setattr(Booster_live, "load_heatmap", lambda ticker: heatmap)
+
+    created = []
+
+    def live_features(tickers):
+        created.append(run_scoring.LiveFeatures(tickers))
+        return created[-1]
+    monkeypatch.setattr(Booster_live, "LiveFeatures", live_features)
+
+    def use(root):
+        store = os.path.join(str(root), "candles.sqlite")
+        monkeypatch.setattr(Booster_live, "FOLDERS", folders(str(root)))
+        monkeypatch.setattr(Booster_live, "consolidate", lambda base: candle_store.consolidate(str(root), store))
+        monkeypatch.setattr(Booster_live, "publish_tails", functools.partial(candle_store.publish_tails, path=store))
+        for folder in folders(str(root)).values():
+            os.makedirs(folder, exist_ok=True)
+    use.features = created
+    return use
+
+
+def build(root, ts, ohlcv, use):
+    use(root)
+    Booster_live.build_timeframes(ts, ohlcv, TICKER)
+
+
+async def run_live(base_url, ws_url, root, until_ts, timeout=15.0):
+    task = asyncio.create_task(Booster_live.live(tickers=[INST_ID], ws_url=ws_url, base_url=base_url))
+    path = os.path.join(folders(root)["3m"], f"{TICKER}_3m.sqlite")
+    try:
+        deadline = asyncio.get_running_loop().time() + timeout
+        while Booster_live.last_saved_ts(path) != until_ts:
+            assert asyncio.get_running_loop().time() < deadline, "живой режим не дошёл до последнего бара"
+            await asyncio.sleep(0.05)
+        await asyncio.sleep(0.5)  # 1h/1d пишутся тем же вызовом sync_tail, хранилище — пачкой после него
+    finally:
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
+
+
+# seed 7 — кросс на баре 500 (сигнал из потокового состояния), 4 — на 499 и 505 (после перезаписи
+# и догрузки), 70 — на 500 и 505
+@pytest.mark.parametrize("seed", [4, 7, 70])
+def test_live_reconnects_backfills_gap_and_overwrites_open_bar(tmp_path, live_env, capsys, seed):
+    ts, ohlcv = make_truth(seed=seed)
+    # Сборка через REST сохранила последний бар ещё открытым — с другим close
+    stored = ohlcv[:N_STORED].copy()
+    last = N_STORED - 1
+    stored[last, 3] = ohlcv[last, 3] + 0.009
+    stored[last, 1] = max(stored[last, 1], stored[last, 3])
+    stored[last, 2] = min(stored[last, 2], stored[last, 3])
+    live_root = tmp_path / "live"
+    build(live_root, ts[:N_STORED], stored, live_env)
+
+    sessions = [
+        # 1-е соединение: подтверждённый открытый бар, следующий бар, незакрытое обновление, обрыв
+        {"send": [ws_message(ts[last], ohlcv[last]), ws_message(ts[N_STORED], ohlcv[N_STORED]),
+                  ws_message(ts[N_STORED + 1], ohlcv[N_STORED + 1], confirm="0")], "close": True},
+        # 2-е соединение: бар после пропуска — промежуток догружается через REST
+        {"send": [ws_message(ts[GAP_TO], ohlcv[GAP_TO])], "close": False},
+    ]
+
+    async def scenario():
+        async with okx_stand_in(ts[:GAP_TO + 1], ohlcv[:GAP_TO + 1], sessions) as (base_url, ws_url, log):
+            await run_live(base_url, ws_url, str(live_root), int(ts[GAP_TO]))
+        return log
+
+    log = asyncio.run(scenario())
+    signals = [line.split(",")[0] for line in capsys.readouterr().out.splitlines() if line.startswith("🔔")]
+
+    assert log["ws"] == 2
+    assert log["rest"] and int(log["rest"][0]["after"]) == ts[GAP_TO]
+
+    got = read_tf(str(live_root), "3m")
+    assert np.array_equal(got["ts"], ts[:GAP_TO + 1])
+    assert float(got["close"].iloc[last]) == ohlcv[last, 3]
+
+    # Сигналы по пришедшим барам совпадают с hma_cross, записанным в базу
+    expected = [
+        f"🔔 {TICKER} {got['date'].iloc[i]} {got['time'].iloc[i]}: HMA-cross {'вверх' if got['hma_cross'].iloc[i] > 0 else 'вниз'}"
+        for i in (last, N_STORED, GAP_TO) if got["hma_cross"].iloc[i]
+    ]
+    assert signals == expected
+
+    # Живые ATR и всплески объёма совпадают с расчётом score_all по окнам баз
+    features = live_env.features[-1].row(TICKER)
+    for tf in run_scoring.FEATURE_TFS:
+        window = read_tf(str(live_root), tf).tail(run_scoring.WINDOWS[tf])
+        m = {col: window[col].astype(float).to_numpy()[None, :] for col in ["high", "low", "close", "vol"]}
+        atr_last = run_scoring.atr(m["high"], m["low"], m["close"], run_scoring.ATR_PERIOD, run_scoring.ATR_METHOD)
+        np.testing.assert_allclose(features[f"atr_pct_{tf}"], atr_last[0, -1] / m["close"][0, -1] * 100, rtol=1e-9)
+        spike = run_scoring.volume_spike(m["vol"], run_scoring.VOLUME_SPIKE_WINDOW, run_scoring.VOLUME_SPIKE_RATIO)
+        assert features[f"vol_spike_{tf}"] == spike[0, -1], tf
+    assert not np.isnan(features["atr_pct_3m"]) and not np.isnan(features["atr_pct_1h"])
+
+    # Итог совпадает с полной сборкой по подтверждённым свечам
+    full_root = tmp_path / "full"
+    build(full_root, ts[:GAP_TO + 1], ohlcv[:GAP_TO + 1], live_env)
+    for tf in ["3m", "1h", "1d"]:
+        columns = [col for col in Booster_live.stored_columns(tf, heatmap=True) if col not in ("ticker", "per", "date", "time")]
+        live_df, full_df = read_tf(str(live_root), tf), read_tf(str(full_root), tf)
+        assert np.array_equal(live_df["ts"], full_df["ts"]), tf
+        for col in columns:
+            np.testing.assert_allclose(live_df[col].astype(float), full_df[col].astype(float),
+                                       rtol=1e-9, atol=1e-12, err_msg=f"{tf}.{col}")
+
+    # Хвосты, опубликованные пачками, дали в хранилище те же ряды, что и в пофайловых базах
+    store = os.path.join(str(live_root), "candles.sqlite")
+    for tf in ["3m", "1h", "1d"]:
+        columns = [col for col in Booster_live.stored_columns(tf, heatmap=True) if col not in ("ticker", "per", "date", "time")]
+        live_df, stored = read_tf(str(live_root), tf), read_candles(TICKER, tf, ["ts"] + columns, path=store)
+        assert np.array_equal(stored["ts"], live_df["ts"]), tf
+        for col in columns:
+            np.testing.assert_array_equal(stored[col].astype(float), live_df[col].astype(float), err_msg=f"{tf}.{col}")
+
+    # Часовые счётчики кроссов собраны из плотности живых часов, а не из NULL
+    counts = read_cross_counts(TICKER, "1h", path=store)
+    full_1h = read_tf(str(full_root), "1h")
+    assert np.array_equal(counts["ts"], full_1h["ts"])
+    assert np.array_equal(counts["count"], full_1h["density_hma_cross"])
@@ -0,0 +1,170 @@
+import time
+import asyncio
+import contextlib
+
+import aiohttp
+import numpy as np
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+import okx_client
+from okx_client import (
+    BAR_MS, HISTORY_CANDLES, MAX_ATTEMPTS, RATE_LIMITS, TokenBucket, fetch_range, fetch_sharded, get_candles,
+)
+
+BAR = "3m"
+T0 = 1_750_000_000_000 // BAR_MS[BAR] * BAR_MS[BAR]
+
+
+def candle_row(ts):
+    return [str(ts), "1", "2", "0.5", "1.5", "10", "10", "15", "1"]
+
+
+def history(ts_all):
+    """Ответ как у history-candles: свечи after > ts > before, новые первыми, не больше limit."""
+    ts_all = np.sort(np.asarray(ts_all))[::-1]
+
+    def respond(request, n):
+        after = int(request.query.get("after", 2**62))
+        before = int(request.query.get("before", -1))
+        limit = int(request.query.get("limit", 100))
+        page = [candle_row(int(ts)) for ts in ts_all if before < ts < after][:limit]
+        return web.json_response({"code": "0", "data": page})
+    return respond
+
+
+@contextlib.asynccontextmanager
+async def okx_server(respond):
+    """Локальный сервер вместо OKX: respond(request, номер запроса) -> Response; журнал — (время, query)."""
+    log = []
+
+    async def handler(request):
+        log.append((time.monotonic(), dict(request.query)))
+        return respond(request, len(log))
+
+    app = web.Application()
+    app.router.add_get(HISTORY_CANDLES, handler)
+    server = TestServer(app)
+    await server.start_server()
+    try:
+        async with aiohttp.ClientSession() as session:
+            yield session, f"http://{server.host}:{server.port}", log
+    finally:
+        await server.close()
+
+
+@pytest.fixture
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(okx_client, "backoff_delay", lambda attempt, base=0.5, cap=10.0: 0.0)
+
+
+# === 429 и коды лимита ===
+@pytest.mark.parametrize("refusal", ["429", "50011", "50061"])
+def test_rate_limit_refusal_penalizes_and_blocks_all_callers(monkeypatch, no_backoff, refusal):
+    pause = 0.3
+    monkeypatch.setattr(okx_client, "RATE_LIMIT_PAUSE", pause)
+
+    def respond(request, n):
+        if n == 1:
+            if refusal == "429":
+                return web.Response(status=429)
+            return web.json_response({"code": refusal, "msg": "Too Many Requests", "data": []})
+        return web.json_response({"code": "0", "data": [candle_row(T0)]})
+
+    async def run():
+        limiter = TokenBucket(100, burst=5)
+        async with okx_server(respond) as (session, base_url, log):
+            first = asyncio.create_task(get_candles(session, limiter, {}, base_url))
+            await asyncio.sleep(0.05)  # второй вызов приходит уже после отказа
+            second = asyncio.create_task(get_candles(session, limiter, {}, base_url))
+            results = await asyncio.gather(first, second)
+        return limiter, log, results
+
+    limiter, log, results = asyncio.run(run())
+    assert all(r == [candle_row(T0)] for r in results)
+    assert limiter.rate < limiter.max_rate
+    refused_at = log[0][0]
+    assert len(log) == 3
+    assert all(t - refused_at >= pause * 0.9 for t, _ in log[1:])
+
+
+def test_penalize_halves_rate_and_reward_restores_it():
+    limiter = TokenBucket(10, burst=1)
+    limiter.penalize(0.0)
+    assert limiter.rate == 5
+    for _ in range(10):
+        limiter.reward()
+    assert limiter.rate == limiter.max_rate
+
+
+# === Завершение листания ===
+def test_fetch_range_stops_on_empty_page():
+    ts_all = T0 + np.arange(250) * BAR_MS[BAR]
+
+    async def run():
+        limiter = TokenBucket(100, burst=10)
+        async with okx_server(history(ts_all)) as (session, base_url, log):
+            out, ok = await fetch_range(session, limiter, "BTC-USDT-SWAP", BAR, T0 - 1000 * BAR_MS[BAR],
+                                        int(ts_all[-1]) + BAR_MS[BAR], base_url=base_url)
+        return out, ok, log
+
+    out, ok, log = asyncio.run(run())
+    ts, _ = out.arrays()
+    assert ok
+    assert np.array_equal(ts, ts_all)
+    assert len(log) == 4  # 100 + 100 + 50 и пустая страница
+
+
+def test_fetch_range_stops_when_cursor_does_not_advance():
+    page = [candle_row(T0 + k * BAR_MS[BAR]) for k in (2, 1, 0)]
+
+    async def run():
+        limiter = TokenBucket(100, burst=10)
+        respond = lambda request, n: web.json_response({"code": "0", "data": page})
+        async with okx_server(respond) as (session, base_url, log):
+            out, ok = await fetch_range(session, limiter, "BTC-USDT-SWAP", BAR, T0 - 100 * BAR_MS[BAR],
+                                        T0 + 10 * BAR_MS[BAR], base_url=base_url)
+        return out, ok, log
+
+    out, ok, log = asyncio.run(run())
+    assert ok
+    assert len(out.arrays()[0]) == 3
+    assert len(log) == 2
+
+
+# === Исчерпание попыток ===
+def test_get_candles_returns_none_after_max_attempts(no_backoff):
+    async def run():
+        limiter = TokenBucket(100, burst=10)
+        respond = lambda request, n: web.Response(status=500)
+        async with okx_server(respond) as (session, base_url, log):
+            data = await get_candles(session, limiter, {}, base_url)
+            _, ok = await fetch_range(session, limiter, "BTC-USDT-SWAP", BAR, T0, T0 + BAR_MS[BAR], base_url=base_url)
+        return data, ok, log
+
+    data, ok, log = asyncio.run(run())
+    assert data is None
+    assert not ok
+    assert len(log) == 2 * MAX_ATTEMPTS
+
+
+# === Темп при длительной загрузке ===
+def test_sustained_throughput_stays_within_okx_limit():
+    limit, per = RATE_LIMITS[HISTORY_CANDLES]
+    ts_all = T0 + np.arange(4500) * BAR_MS[BAR]
+
+    async def run():
+        limiter = TokenBucket.for_endpoint()
+        async with okx_server(history(ts_all)) as (session, base_url, log):
+            out, ok = await fetch_sharded(session, limiter, "BTC-USDT-SWAP", BAR, int(ts_all[0]),
+                                          int(ts_all[-1]) + BAR_MS[BAR], shards=8, base_url=base_url)
+        return out, ok, log
+
+    out, ok, log = asyncio.run(run())
+    assert ok
+    assert np.array_equal(out.arrays()[0], ts_all)
+    times = np.array([t for t, _ in log])
+    assert len(times) >= 45
+    in_window = np.searchsorted(times, times + per, side="left") - np.arange(len(times))
+    assert in_window.max() <= limit